@@ -0,0 +1,190 @@
+import os
+import json
+import queue
+import atexit
+import datetime
+import threading
+
+# Activity events are queued in memory and written with insert_many by a background thread,
+# once BATCH_SIZE events are waiting or every FLUSH_SECONDS, whichever comes first
+BATCH_SIZE = int(os.environ.get('ACTIVITY_LOG_BATCH_SIZE', 100))
+FLUSH_SECONDS = float(os.environ.get('ACTIVITY_LOG_FLUSH_SECONDS', 1.0))
+# Events waiting to be written; when the queue is full (e.g. MongoDB is down) new events are dropped
+QUEUE_SIZE = int(os.environ.get('ACTIVITY_LOG_QUEUE_SIZE', 10000))
+
+# A batch that fails to write (e.g. while MongoDB is down) is retried on each following flush, up to
+# RETRIES times; then it and every queued event are appended as JSON lines to FALLBACK_PATH
+RETRIES = int(os.environ.get('ACTIVITY_LOG_RETRIES', 30))
+FALLBACK_PATH = os.environ.get('ACTIVITY_LOG_FALLBACK_PATH',
+                               os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                            'temp', 'activity_log_failed.jsonl'))
+
+# How long log() waits for room in a full queue before dropping the event
+ENQUEUE_TIMEOUT_SECONDS = 0.5
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_queue = None
+_queue_pid = None
+_thread = None
+_stop = None
+_wake = None
+_failed_batch = None
+_failed_attempts = 0
+
+
+def _get_queue():
+    """Return this process's queue, starting the writer thread on first use (and again after a fork)"""
+    global _queue, _queue_pid, _thread, _stop, _wake, _failed_batch, _failed_attempts
+    with _lock:
+        if _queue is None or _queue_pid != os.getpid():
+            _queue = queue.Queue(maxsize=QUEUE_SIZE)
+            _failed_batch = None
+            _failed_attempts = 0
+            _queue_pid = os.getpid()
+            _stop = threading.Event()
+            _wake = threading.Event()
+            _thread = threading.Thread(target=_run, args=(_stop, _wake), name='activity-log-writer', daemon=True)
+            _thread.start()
+        return _queue
+
+
+def _run(stop, wake):
+    while not stop.is_set():
+        wake.wait(FLUSH_SECONDS)
+        wake.clear()
+        flush()
+
+
+def log(username, action_type, filename, timestamp=None):
+    """
+    Queue an activity event with the activity_logs schema (username,
+    action_type, filename, timestamp) without touching the database.
+    Returns False if the event was dropped because the queue stayed full.
+    """
+    # Use current time if timestamp not provided
+    if timestamp is None:
+        timestamp = datetime.datetime.now()
+
+    activity = {
+        "username": username,
+        "action_type": action_type,
+        "filename": filename,
+        "timestamp": timestamp
+    }
+
+    events = _get_queue()
+    try:
+        events.put(activity, timeout=ENQUEUE_TIMEOUT_SECONDS)
+    except queue.Full:
+        print(f"\033[91m[ERROR]\033[0m Activity log queue is full, dropped {action_type} event for '{username}'")
+        return False
+    if events.qsize() >= BATCH_SIZE:
+        _wake.set()
+    return True
+
+
+def _take_batch():
+    batch = []
+    while len(batch) < BATCH_SIZE:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _drain():
+    """Every event still queued"""
+    events = []
+    while True:
+        batch = _take_batch()
+        if not batch:
+            return events
+        events.extend(batch)
+
+
+def _json_value(value):
+    # Timestamps as ISO 8601; the _id insert_many gave an event (an ObjectId) as its hex string
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def write_fallback(events):
+    """
+    Append events as JSON lines to FALLBACK_PATH, to be imported once MongoDB
+    is back. Events keep the _id of their failed inserts, so an event that did
+    reach MongoDB after all is recognisable on import.
+    """
+    try:
+        os.makedirs(os.path.dirname(FALLBACK_PATH) or '.', exist_ok=True)
+        with open(FALLBACK_PATH, 'a', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, default=_json_value) + '\n')
+    except Exception as e:
+        print(f"\033[91m[ERROR]\033[0m Could not save {len(events)} activity events to {FALLBACK_PATH}: {str(e)}")
+        return False
+    print(f"\033[93m[WARNING]\033[0m Saved {len(events)} unwritten activity events to {FALLBACK_PATH}")
+    return True
+
+
+def flush():
+    """
+    Write every queued event of this process now, BATCH_SIZE per insert_many.
+    The events of a batch that fail (all of them when MongoDB is unreachable)
+    stop the flush and are retried first on the next one; after RETRIES failed
+    retries they are saved to FALLBACK_PATH, together with every queued event.
+    Returns the number of events written.
+    """
+    import database
+    global _failed_batch, _failed_attempts
+
+    if _queue is None or _queue_pid != os.getpid():
+        return 0
+
+    written = 0
+    with _flush_lock:
+        while True:
+            # The failed batch goes first, so events are written in order
+            batch = _failed_batch or _take_batch()
+            if not batch:
+                return written
+            try:
+                unwritten = database.insert_activities(batch)
+                error = "rejected by the database"
+            except Exception as e:
+                unwritten, error = batch, str(e)
+            if len(unwritten) < len(batch):
+                written += len(batch) - len(unwritten)
+                print(f"\033[92m[SUCCESS]\033[0m Logged {len(batch) - len(unwritten)} activity events")
+            if unwritten:
+                attempts = _failed_attempts + 1 if _failed_batch else 1
+                print(f"\033[91m[ERROR]\033[0m Failed to write {len(unwritten)} activity events "
+                      f"(attempt {attempts}): {error}")
+                if attempts > RETRIES:
+                    write_fallback(unwritten + _drain())
+                    _failed_batch, _failed_attempts = None, 0
+                else:
+                    _failed_batch, _failed_attempts = unwritten, attempts
+                return written
+            _failed_batch, _failed_attempts = None, 0
+
+
+def shutdown(timeout=5):
+    """Stop the writer thread and write whatever is still queued; what cannot be written is saved to FALLBACK_PATH"""
+    global _failed_batch
+    if _queue is None or _queue_pid != os.getpid():
+        return
+    _stop.set()
+    _wake.set()
+    _thread.join(timeout)
+    flush()
+    with _flush_lock:
+        events = (_failed_batch or []) + _drain()
+        _failed_batch = None
+        if events:
+            write_fallback(events)
+
+
+atexit.register(shutdown)
@@ -1,18 +1,24 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify, Response, stream_with_context
 import os
-import shutil
+import json
 from werkzeug.utils import secure_filename
-import fitz
 from dotenv import load_dotenv
 from authlib.integrations.flask_client import OAuth
 import secrets
+import threading
+import click
+from pymongo.errors import ConnectionFailure
 
 # Import other modules
 import image_operations 
+import compression
 import pdf_operations 
 import zip_operations 
 import database 
 import chatbot_service 
+import workspace
+import worker_pool
+import decrypt_cache
 
 # Get the project root directory
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -46,13 +52,76 @@ def create_app():
     ALLOWED_EXTENSIONS_IMAGE = {'png', 'jpg', 'jpeg'}
     ALLOWED_EXTENSIONS_PDF = {'pdf'}
 
+    # Maximum number of files accepted in one /encrypt request
+    MAX_FILES_PER_BATCH = int(os.environ.get('ENCRYPT_MAX_FILES', 50))
+
+    # "bytes" encrypts any file type byte for byte; "text" keeps the original text-only pipeline
+    ENCRYPT_CODEC = os.environ.get('ENCRYPT_CODEC', 'bytes')
+    if ENCRYPT_CODEC not in image_operations.CODECS:
+        raise ValueError(f"ENCRYPT_CODEC must be one of {', '.join(image_operations.CODECS)}")
+
+    # Keep a copy of every uploaded file in UPLOAD_FOLDER; by default uploads are encrypted straight from
+    # the request stream and the app saves no copy of its own (Werkzeug still spools uploads over
+    # 500 KB to a temporary file while it parses the form)
+    KEEP_UPLOADS = os.environ.get('KEEP_UPLOADS', '').lower() in ('1', 'true', 'yes')
+
+    # Uploads per worker read into memory before they are handed to the pool
+    ENCRYPT_WINDOW_PER_WORKER = 2
+
     # Create necessary directories
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    os.makedirs(os.path.join(PROJECT_ROOT, 'static', 'enimg'), exist_ok=True)
     os.makedirs(os.path.join(PROJECT_ROOT, 'uploads'), exist_ok=True)
 
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+    # Create missing MongoDB indexes in the background, so startup never waits for the database
+    def bootstrap_indexes():
+        try:
+            database.ensure_indexes()
+        except Exception as e:
+            print(f"\033[93m[WARNING]\033[0m Skipped MongoDB index bootstrap: {type(e).__name__}. "
+                  "Run 'flask --app run ensure-indexes' once MongoDB is reachable.")
+
+    if os.environ.get('MONGODB_ENSURE_INDEXES', 'true').lower() in ('1', 'true', 'yes'):
+        threading.Thread(target=bootstrap_indexes, name='index-bootstrap', daemon=True).start()
+
+    @app.cli.command('ensure-indexes')
+    def ensure_indexes_command():
+        """Create the MongoDB indexes the app relies on (safe to run repeatedly)."""
+        try:
+            results = database.ensure_indexes()
+        except ConnectionFailure as e:
+            raise click.ClickException(f"MongoDB is unreachable: {e}")
+        failed = False
+        for collection, name, error in results:
+            click.echo(f"{collection}.{name}: {error or 'ok'}")
+            failed = failed or error is not None
+        if failed:
+            raise SystemExit(1)
+
+    @app.cli.command('explain-queries')
+    @click.option('--username', help='User to run the queries for (default: any stored user)')
+    @click.option('--email', help='Email to look up (default: that user\'s email)')
+    def explain_queries_command(username, email):
+        """Print the MongoDB query plan of every hot query; COLLSCAN means a collection scan."""
+        try:
+            if not username or not email:
+                user = database.get_db().users.find_one({"username": username} if username else {}) or {}
+                username = username or user.get("username", "guest")
+                email = email or user.get("email", "guest@example.com")
+            summaries = [(description, database.explain_query(cursor))
+                         for description, cursor in database.hot_queries(username, email)]
+        except ConnectionFailure as e:
+            raise click.ClickException(f"MongoDB is unreachable: {e}")
+        click.echo(f"username={username!r} email={email!r}")
+        for description, summary in summaries:
+            scan = ' (collection scan)' if 'COLLSCAN' in summary['stages'] else ''
+            click.echo(f"\n{description}")
+            click.echo(f"  plan: {' > '.join(summary['stages'])}{scan}")
+            click.echo(f"  indexes: {', '.join(summary['indexes']) or 'none'}")
+            click.echo(f"  returned {summary['returned']}, keys examined {summary['keys_examined']}, "
+                       f"documents examined {summary['docs_examined']}, {summary['time_ms']} ms")
+
     def allowed_file(filename, file_type):
         if file_type == 'text':
             return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS_TEXT
@@ -60,6 +129,8 @@ def create_app():
             return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS_IMAGE
         elif file_type == 'pdf':
             return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS_PDF
+        elif file_type == 'any':
+            return bool(filename)
         return False
 
     @app.route('/')
@@ -204,28 +275,79 @@ def create_app():
                 flash('No selected files', 'error')
                 return redirect(request.url)
             
-            image_paths = []
-            for file in files:
-                if file and allowed_file(file.filename, 'text'):
-                    filename = secure_filename(file.filename)
-                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    file.save(filepath)
-                    
-                    # Process the file (encrypt)
-                    encrypted_image = image_operations.encrypt_file(filepath)
-                    
-                    # Ensure the static/enimg directory exists
-                    static_enimg_dir = os.path.join(PROJECT_ROOT, 'static', 'enimg')
-                    os.makedirs(static_enimg_dir, exist_ok=True)
-                    
-                    # Move the image to the static folder with proper path handling
-                    filename = os.path.basename(encrypted_image)
-                    static_image_path = os.path.join(static_enimg_dir, filename)
-                    
-                    if not os.path.exists(static_image_path):
-                        shutil.copy(encrypted_image, static_image_path)
+            if len(files) > MAX_FILES_PER_BATCH:
+                flash(f'You can encrypt at most {MAX_FILES_PER_BATCH} files at once', 'error')
+                return redirect(request.url)
+            
+            # PNG encoding profile (speed vs. size) for this batch
+            profile = request.form.get('profile') or image_operations.DEFAULT_PNG_PROFILE
+            if profile not in image_operations.PNG_PROFILES:
+                flash('Unknown image encoding profile', 'error')
+                return redirect(request.url)
+            
+            # Payload compressor applied before the data is packed into pixels
+            compression_method = request.form.get('compression') or compression.DEFAULT_COMPRESSION
+            if compression_method not in compression.COMPRESSIONS:
+                flash('Unknown compression method', 'error')
+                return redirect(request.url)
+            
+            # The PDF is downloaded in a later request, so it lives in a per-session job workspace
+            job = workspace.create_job()
+            
+            # Intermediate files (the spool of sharded files) stay private to this request
+            with workspace.Workspace() as scratch:
+                streams = []
+                filenames = []
+                for file in files:
+                    if file and allowed_file(file.filename, 'any' if ENCRYPT_CODEC == 'bytes' else 'text'):
+                        filename = secure_filename(file.filename)
+                        if KEEP_UPLOADS:
+                            upload_dir = os.path.join(app.config['UPLOAD_FOLDER'], job.id)
+                            os.makedirs(upload_dir, exist_ok=True)
+                            file.save(os.path.join(upload_dir, f'{len(streams)}_{filename}'))
+                            file.stream.seek(0)
+                        streams.append(file.stream)
+                        filenames.append(filename)
+                
+                # Files too large for one image of at most SHARD_MAX_DIMENSION per side are sharded
+                sharded = [image_operations.needs_sharding(stream, filename) for stream, filename in zip(streams, filenames)]
+                
+                # The upload streams feed the encoder directly, without being saved and re-read. Files are
+                # read and sent to the worker pool a window at a time; results come back in upload order.
+                # Images land in the content-addressed store, so repeated content is not re-encoded.
+                singles = [(stream, filename) for stream, filename, is_sharded in zip(streams, filenames, sharded)
+                           if not is_sharded]
+                window = max(1, worker_pool.POOL_SIZE) * ENCRYPT_WINDOW_PER_WORKER
+                single_results = []
+                for start in range(0, len(singles), window):
+                    # The bytes codec stores the name, so decryption restores the original file
+                    tasks = [(stream.read(), None, profile, ENCRYPT_CODEC, filename or None, compression_method)
+                             for stream, filename in singles[start:start + window]]
+                    single_results.extend(worker_pool.run_tasks(image_operations.encrypt_stream, tasks))
+                single_results = iter(single_results)
+                results = []
+                for stream, filename, is_sharded in zip(streams, filenames, sharded):
+                    if not is_sharded:
+                        success, result = next(single_results)
+                        results.append((success, [result] if success else result))
+                        continue
+                    # The shards of one file are encoded in parallel across the pool
+                    try:
+                        manifest = image_operations.encrypt_file_sharded(stream, profile, ENCRYPT_CODEC, filename or None,
+                                                                         compression_method,
+                                                                         spool_dir=scratch.makedirs('spool'))
+                        results.append((True, image_operations.shard_images(manifest)))
+                    except Exception as e:
+                        results.append((False, worker_pool.describe_error(e)))
+                
+                image_paths = []
+                for filename, (success, result) in zip(filenames, results):
+                    if not success:
+                        print(f"\033[91m[ERROR]\033[0m Failed to encrypt '{filename}': {result}")
+                        flash(f'Failed to encrypt {filename}', 'error')
+                        continue
                     
-                    image_paths.append(static_image_path)
+                    image_paths.extend(result)
                     
                     # Log activity
                     if 'username' in session:
@@ -234,14 +356,25 @@ def create_app():
                             action_type='encrypt',
                             filename=filename
                         )
+                
+                if not image_paths:
+                    job.cleanup()
+                    flash('None of the selected files could be encrypted', 'error')
+                    return redirect(request.url)
+                
+                # Create PDF from images: the PNG data is copied into the PDF as is, in one write
+                pdf_output_path = job.path('encrypted_images.pdf')
+                pdf_operations.build_pdf(image_paths, pdf_output_path)
             
-            # Create PDF from images
-            pdf_output_path = os.path.join(PROJECT_ROOT, 'static', 'encrypted_images.pdf')
-            pdf_operations.create_pdf_from_images(image_paths, pdf_output_path)
+            # Replace this session's previous result
+            workspace.discard_job(session.get('encrypt_job'))
+            session['encrypt_job'] = job.id
             
             return render_template('encrypt_success.html', filename='encrypted_images.pdf')
         
-        return render_template('encrypt.html')
+        return render_template('encrypt.html', any_file_type=ENCRYPT_CODEC == 'bytes',
+                               default_compression=compression.DEFAULT_COMPRESSION,
+                               default_profile=image_operations.DEFAULT_PNG_PROFILE)
 
     @app.route('/decrypt', methods=['GET', 'POST'])
     def decrypt():
@@ -261,46 +394,28 @@ def create_app():
             
             if file and allowed_file(file.filename, 'pdf'):
                 filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
                 
-                # Extract images from PDF using PyMuPDF
-                pdf_document = fitz.open(filepath)
-                decrypted_files = []
-                processed_images = set()  # Track processed images to avoid duplicates
+                # The ZIP is downloaded in a later request, so it lives in a per-session job workspace
+                job = workspace.create_job()
+                decrypted_dir = job.makedirs('decrypted')
                 
-                for page_number in range(len(pdf_document)):
-                    page = pdf_document.load_page(page_number)
-                    image_list = page.get_images(full=True)
-                    
-                    for image_index, img in enumerate(image_list):
-                        xref = img[0]
-                        if xref in processed_images:
-                            continue  # Skip already processed images
-                        
-                        base_image = pdf_document.extract_image(xref)
-                        image_bytes = base_image["image"]
-                        
-                        # Generate a unique name for the decrypted file
-                        unique_name = f'decrypted_{page_number}_{image_index}.txt'
-                        decrypted_file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_name)
-                        
-                        # Save the image to a temporary file
-                        image_path = os.path.join(app.config['UPLOAD_FOLDER'], f'image_{page_number}_{image_index}.png')
-                        with open(image_path, 'wb') as img_file:
-                            img_file.write(image_bytes)
-                        
-                        # Process the image (decrypt)
-                        decrypted_file = image_operations.decrypt_file(image_path)
-                        shutil.move(decrypted_file, decrypted_file_path)
-                        decrypted_files.append(decrypted_file_path)
-                        
-                        processed_images.add(xref)  # Mark this image as processed
+                # Only the pieces of sharded files touch the disk, privately to this request
+                with workspace.Workspace() as scratch:
+                    # Open the PDF from the upload stream, decode its images (each xref once) from
+                    # PyMuPDF's pixel samples and decrypt them across the worker pool, reusing cached
+                    # results for images seen before. No upload or image files are written.
+                    decrypted_files, errors = pdf_operations.decrypt_pdf(file.stream, scratch.path('shards'), decrypted_dir)
+                    for error in errors:
+                        print(f"\033[91m[ERROR]\033[0m Failed to decrypt {error}")
+                        flash(f'Failed to decrypt {error.split(":")[0]}', 'error')
                 
-                # Create a zip file with decrypted files
-                zip_filename = 'decrypted_files.zip'
-                zip_path = os.path.join(app.config['UPLOAD_FOLDER'], zip_filename)
-                zip_operations.create_zip_from_files(decrypted_files, zip_path)
+                # The ZIP is streamed by /download_zip; only the order of the files is kept
+                with open(job.path('decrypted_files.json'), 'w') as f:
+                    json.dump([os.path.basename(path) for path in decrypted_files], f)
+                
+                # Replace this session's previous result
+                workspace.discard_job(session.get('decrypt_job'))
+                session['decrypt_job'] = job.id
                 
                 # Log activity
                 if 'username' in session:
@@ -314,15 +429,41 @@ def create_app():
         
         return render_template('decrypt.html')
 
+    def job_file(session_key, filename):
+        """Path of a result file in this session's job workspace, or None if it has expired"""
+        job = workspace.open_job(session.get(session_key))
+        if job is None or not os.path.exists(job.path(filename)):
+            return None
+        return job.path(filename)
+
     @app.route('/download_pdf')
     def download_pdf():
-        pdf_path = os.path.join(PROJECT_ROOT, 'static', 'encrypted_images.pdf')
+        pdf_path = job_file('encrypt_job', 'encrypted_images.pdf')
+        if pdf_path is None:
+            flash('Your encrypted PDF is no longer available. Please encrypt the files again.', 'error')
+            return redirect(url_for('encrypt'))
         return send_file(pdf_path, as_attachment=True, download_name='encrypted_images.pdf')
 
     @app.route('/download_zip')
     def download_zip():
-        zip_path = os.path.join(app.config['UPLOAD_FOLDER'], 'decrypted_files.zip')
-        return send_file(zip_path, as_attachment=True, download_name='decrypted_files.zip')
+        listing_path = job_file('decrypt_job', 'decrypted_files.json')
+        if listing_path is None:
+            flash('Your decrypted files are no longer available. Please decrypt the PDF again.', 'error')
+            return redirect(url_for('decrypt'))
+        with open(listing_path) as f:
+            names = json.load(f)
+        decrypted_dir = os.path.join(os.path.dirname(listing_path), 'decrypted')
+
+        # ?level=0 stores the files, 1-9 deflates them
+        level = request.args.get('level', type=int)
+        if level is not None and not 0 <= level <= 9:
+            level = None
+
+        # The archive is generated while it is sent, so the first bytes go out immediately
+        entries = ((name, os.path.join(decrypted_dir, name)) for name in names)
+        return Response(stream_with_context(zip_operations.iter_zip(entries, level)),
+                        mimetype='application/zip',
+                        headers={'Content-Disposition': 'attachment; filename=decrypted_files.zip'})
 
     @app.route('/logout')
     def logout():
@@ -333,6 +474,30 @@ def create_app():
         # Redirect to home page
         return redirect(url_for('index'))
 
+    # Activities per page of the activity log
+    ACTIVITY_PAGE_SIZE = 50
+
+    def activity_filters():
+        """
+        Page filters from the query string: action ('encrypt' or 'decrypt'),
+        from/to dates (YYYY-MM-DD, both inclusive) and the cursor of the page.
+        Raises ValueError for an invalid value.
+        """
+        import datetime
+
+        action_type = request.args.get('action') or None
+        if action_type not in (None, 'encrypt', 'decrypt'):
+            raise ValueError('Unknown action type')
+        start = end = None
+        if request.args.get('from'):
+            start = datetime.datetime.strptime(request.args['from'], '%Y-%m-%d')
+        if request.args.get('to'):
+            end = datetime.datetime.strptime(request.args['to'], '%Y-%m-%d') + datetime.timedelta(days=1)
+        cursor = request.args.get('cursor') or None
+        if cursor:
+            database.decode_activity_cursor(cursor)
+        return {"action_type": action_type, "start": start, "end": end, "cursor": cursor}
+
     @app.route('/activity')
     def activity_log():
         if 'username' not in session:
@@ -340,8 +505,14 @@ def create_app():
         
         username = session['username']
         
-        # Get all activities for the user
-        activities = database.get_user_activities(username)
+        try:
+            filters = activity_filters()
+        except ValueError:
+            flash('Invalid activity filter', 'error')
+            return redirect(url_for('activity_log'))
+        
+        # One page of the user's activities; older pages follow the cursor
+        activities, next_cursor = database.get_activity_page(username, ACTIVITY_PAGE_SIZE, **filters)
         
         # Format timestamps for display
         for activity in activities:
@@ -349,7 +520,49 @@ def create_app():
             if 'timestamp' in activity and activity['timestamp']:
                 activity['timestamp_str'] = activity['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
         
-        return render_template('activity_log.html', username=username, activities=activities)
+        # Links keep the filters; the first page drops the cursor
+        page_args = {key: request.args[key] for key in ('action', 'from', 'to') if request.args.get(key)}
+        next_url = url_for('activity_log', cursor=next_cursor, **page_args) if next_cursor else None
+        first_url = url_for('activity_log', **page_args) if filters['cursor'] else None
+        
+        return render_template('activity_log.html', username=username, activities=activities,
+                               next_url=next_url, first_url=first_url, filters=page_args)
+
+    @app.route('/api/activity')
+    def activity_api():
+        if 'username' not in session:
+            return jsonify({"error": "Not logged in"}), 401
+        
+        try:
+            filters = activity_filters()
+            limit = min(max(int(request.args.get('limit', ACTIVITY_PAGE_SIZE)), 1), 200)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        activities, next_cursor = database.get_activity_page(session['username'], limit, **filters)
+        for activity in activities:
+            if activity.get('timestamp'):
+                activity['timestamp'] = activity['timestamp'].isoformat()
+        return jsonify({"activities": activities, "next_cursor": next_cursor})
+
+    @app.route('/healthz')
+    def healthz():
+        # Liveness: the process is serving requests; dependencies are not checked
+        return jsonify({"status": "ok"})
+
+    @app.route('/readyz')
+    def readyz():
+        # Readiness: MongoDB answers a ping through the shared connection pool
+        ready, message = database.check_connection()
+        return jsonify({"status": "ready" if ready else "unavailable", "mongodb": message}), 200 if ready else 503
+
+    @app.route('/api/decrypt_cache/stats')
+    def decrypt_cache_stats():
+        if 'username' not in session:
+            return jsonify({"error": "Not logged in"}), 401
+        
+        # Hit/miss counters of this worker process's decrypt cache, for sizing the cache
+        return jsonify(decrypt_cache.stats())
 
     # Chatbot API route
     @app.route('/api/chatbot', methods=['POST'])
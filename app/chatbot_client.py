@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+import email.utils
+import requests
+from requests.adapters import HTTPAdapter
+
+# Seconds allowed to open a connection to the chatbot API and to wait for its reply
+CHATBOT_CONNECT_TIMEOUT = float(os.environ.get('CHATBOT_CONNECT_TIMEOUT', 3.05))
+CHATBOT_READ_TIMEOUT = float(os.environ.get('CHATBOT_READ_TIMEOUT', 30))
+# Retries after a connection error or a 429/5xx status, waiting BACKOFF_SECONDS * 2^retry between
+# tries, or the response's Retry-After; a response asking to wait longer than MAX_BACKOFF_SECONDS
+# is returned as is. Read timeouts are not retried, so a slow API costs one READ_TIMEOUT at most.
+CHATBOT_MAX_RETRIES = int(os.environ.get('CHATBOT_MAX_RETRIES', 2))
+CHATBOT_BACKOFF_SECONDS = float(os.environ.get('CHATBOT_BACKOFF_SECONDS', 0.5))
+CHATBOT_MAX_BACKOFF_SECONDS = float(os.environ.get('CHATBOT_MAX_BACKOFF_SECONDS', 10))
+# Keep-alive connections to the chatbot API kept open per process
+CHATBOT_POOL_SIZE = int(os.environ.get('CHATBOT_POOL_SIZE', 10))
+# After this many failed calls in a row (0 = never) calls fail at once for BREAKER_RESET_SECONDS,
+# then a single trial call decides whether the API is back
+CHATBOT_BREAKER_FAILURES = int(os.environ.get('CHATBOT_BREAKER_FAILURES', 5))
+CHATBOT_BREAKER_RESET_SECONDS = float(os.environ.get('CHATBOT_BREAKER_RESET_SECONDS', 30))
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """The chatbot API failed repeatedly, so the call was not made"""
+
+
+class CircuitBreaker:
+    """
+    Counts failed calls in a row. Once max_failures is reached the circuit is
+    open and allow() refuses calls for reset_seconds; then it lets one trial
+    call through (half-open). Its success closes the circuit, its failure
+    opens it again.
+    """
+
+    def __init__(self, max_failures=None, reset_seconds=None):
+        self.max_failures = CHATBOT_BREAKER_FAILURES if max_failures is None else max_failures
+        self.reset_seconds = CHATBOT_BREAKER_RESET_SECONDS if reset_seconds is None else reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._trial or time.monotonic() - self._opened_at >= self.reset_seconds:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self.max_failures and (self._opened_at is not None or self._failures >= self.max_failures):
+                if self._opened_at is None:
+                    print(f"\033[91m[ERROR]\033[0m Chatbot API failed {self._failures} times in a row, "
+                          f"pausing calls for {self.reset_seconds:g}s")
+                self._opened_at = time.monotonic()
+
+
+def retry_after(response):
+    """Seconds to wait from a response's Retry-After header (seconds or an HTTP date), or None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ChatbotClient:
+    """
+    HTTP client for the chatbot API: a Session with a pool of keep-alive
+    connections, connect/read timeouts on every request, bounded retries with
+    exponential backoff on connection errors and 429/5xx responses, and a
+    circuit breaker that fails fast while the API is down.
+    """
+
+    def __init__(self, connect_timeout=None, read_timeout=None, max_retries=None, backoff_seconds=None,
+                 max_backoff_seconds=None, pool_size=None, breaker=None):
+        self.timeout = (CHATBOT_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout,
+                        CHATBOT_READ_TIMEOUT if read_timeout is None else read_timeout)
+        self.max_retries = CHATBOT_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_seconds = CHATBOT_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+        self.max_backoff_seconds = CHATBOT_MAX_BACKOFF_SECONDS if max_backoff_seconds is None else max_backoff_seconds
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        # Retries are done by post(), so the adapter only pools connections
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CHATBOT_POOL_SIZE if pool_size is None else pool_size,
+                              max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def post(self, url, **kwargs):
+        """
+        POST to the API like requests.post and return the final response, which
+        may still be a 429/5xx once the retries are used up. Raises
+        CircuitOpenError without calling the API while the circuit is open, and
+        requests' exceptions for connection errors and timeouts.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Chatbot API calls are paused after repeated failures ({url})")
+
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(url, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    raise
+                delay = self.backoff(attempt)
+                print(f"\033[93m[WARNING]\033[0m Chatbot API connection failed ({e}), retrying in {delay:.2f}s")
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                delay = retry_after(response)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                if attempt >= self.max_retries or delay > self.max_backoff_seconds:
+                    self.breaker.record_failure()
+                    return response
+                response.close()
+                print(f"\033[93m[WARNING]\033[0m Chatbot API answered {response.status_code}, retrying in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    def backoff(self, attempt):
+        return min(self.backoff_seconds * 2 ** attempt, self.max_backoff_seconds)
+
+    def close(self):
+        self.session.close()
+
+
+def get_client():
+    """Return the process-wide ChatbotClient, creating it on first use (and again after a fork)"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = ChatbotClient()
+            _client_pid = os.getpid()
+        return _client
@@ -1,9 +1,122 @@
 import os
+import math
 import requests
 import re
 import random
+import threading
+import chatbot_client
+from collections import OrderedDict
 from flask import session
-from database import get_user_memory, update_user_memory, extract_user_info, get_conversation_history, add_to_conversation_history
+from database import update_user_memories, extract_user_info, get_conversation_history, add_conversation_messages
+
+# Conversation history sent with each message: at most CHATBOT_HISTORY_MESSAGES of the latest
+# messages, loaded with a $slice projection, then trimmed from the oldest to CHATBOT_HISTORY_CHARS
+# characters of content (about 4 characters per token; 0 = no character limit)
+CHATBOT_HISTORY_MESSAGES = int(os.environ.get('CHATBOT_HISTORY_MESSAGES', 40))
+CHATBOT_HISTORY_CHARS = int(os.environ.get('CHATBOT_HISTORY_CHARS', 12000))
+# Shortest message assumed when sizing the $slice: no more than CHATBOT_HISTORY_CHARS /
+# CHATBOT_MIN_MESSAGE_CHARS messages are loaded, so a small budget also means a small fetch
+# (0 = load CHATBOT_HISTORY_MESSAGES regardless of the budget)
+CHATBOT_MIN_MESSAGE_CHARS = int(os.environ.get('CHATBOT_MIN_MESSAGE_CHARS', 100))
+# Users whose assembled system prompt is cached (per process, least recently used evicted first)
+CHATBOT_PROMPT_CACHE_SIZE = int(os.environ.get('CHATBOT_PROMPT_CACHE_SIZE', 1024))
+
+SYSTEM_PROMPT_INTRO = "You are a helpful assistant for the PixelMind text encryption system. "
+SYSTEM_PROMPT_INSTRUCTIONS = "\nWhen responding, make 1-4 important keywords in your response bold by surrounding them with ** (e.g., **keyword**). Choose only the most important words to emphasize. Keep your answers concise and helpful."
+
+_prompt_cache = OrderedDict()
+_prompt_cache_lock = threading.Lock()
+
+
+def build_system_prompt(user_memory):
+    """Assemble the system prompt: the introduction, what is known about the user, then the instructions"""
+    parts = [SYSTEM_PROMPT_INTRO]
+    
+    # Add user memory to system message if available
+    if user_memory:
+        parts.append("Here is what you know about the user:\n")
+        if user_memory.get("name"):
+            parts.append(f"- Name: {user_memory['name']}\n")
+        if user_memory.get("place"):
+            parts.append(f"- Location: {user_memory['place']}\n")
+        if user_memory.get("friends"):
+            parts.append(f"- Friends: {', '.join(user_memory['friends'])}\n")
+        if user_memory.get("priorities"):
+            parts.append(f"- Priorities: {', '.join(user_memory['priorities'])}\n")
+        if user_memory.get("preferences"):
+            parts.append("- Preferences:\n")
+            for pref, sentiment in user_memory["preferences"].items():
+                parts.append(f"  - {pref}: {sentiment}\n")
+        if user_memory.get("other_info"):
+            parts.append("- Other Information:\n")
+            for key, value in user_memory["other_info"].items():
+                parts.append(f"  - {key}: {value}\n")
+    
+    parts.append(SYSTEM_PROMPT_INSTRUCTIONS)
+    return "".join(parts)
+
+
+def get_system_prompt(username, user_memory):
+    """
+    The system prompt for a user, assembled once per version of their memory.
+    Each memory write increments the document's version, so a cached prompt
+    is rebuilt as soon as the memory changes, in any process.
+    """
+    if not user_memory:
+        return build_system_prompt(user_memory)
+    
+    key = (user_memory.get("_id"), user_memory.get("version", 0))
+    with _prompt_cache_lock:
+        cached = _prompt_cache.get(username)
+        if cached and cached[0] == key:
+            _prompt_cache.move_to_end(username)
+            return cached[1]
+    
+    system_message = build_system_prompt(user_memory)
+    with _prompt_cache_lock:
+        _prompt_cache[username] = (key, system_message)
+        _prompt_cache.move_to_end(username)
+        while len(_prompt_cache) > CHATBOT_PROMPT_CACHE_SIZE:
+            _prompt_cache.popitem(last=False)
+    return system_message
+
+
+def history_fetch_limit():
+    """
+    Messages to load for the prompt: CHATBOT_HISTORY_MESSAGES, or fewer when
+    CHATBOT_HISTORY_CHARS cannot hold that many messages of
+    CHATBOT_MIN_MESSAGE_CHARS characters
+    """
+    limit = CHATBOT_HISTORY_MESSAGES
+    if CHATBOT_HISTORY_CHARS > 0 and CHATBOT_MIN_MESSAGE_CHARS > 0:
+        limit = min(limit, math.ceil(CHATBOT_HISTORY_CHARS / CHATBOT_MIN_MESSAGE_CHARS))
+    return limit
+
+
+def trim_history(messages, char_budget=None):
+    """
+    The latest messages whose content fits in char_budget characters
+    (CHATBOT_HISTORY_CHARS when None; 0 = no limit), starting with a user
+    message so the model never sees a reply without its question
+    """
+    if char_budget is None:
+        char_budget = CHATBOT_HISTORY_CHARS
+    
+    start = len(messages)
+    if char_budget > 0:
+        used = 0
+        while start > 0:
+            used += len(messages[start - 1].get("content") or "")
+            if used > char_budget:
+                break
+            start -= 1
+    else:
+        start = 0
+    
+    while start < len(messages) and messages[start].get("role") == "assistant":
+        start += 1
+    return messages[start:]
+
 
 def get_chatbot_response(user_message, conversation_history=None, username=None):
     """
@@ -29,60 +142,32 @@ def get_chatbot_response(user_message, conversation_history=None, username=None)
     
     # Extract user information from message
     memory_updates = []
+    user_memory = {}
     if username != "guest":
         user_info = extract_user_info(user_message)
         print(f"\033[96m[DEBUG]\033[0m Extracted user info: {user_info}")
         
-        if user_info:  # Only process if we found information
-            for memory_type, value in user_info:
-                update_result = update_user_memory(username, memory_type, value)
-                if update_result:
-                    memory_updates.append(update_result)
+        # All facts of the message are written in one update, which also returns the updated memory
+        user_memory, memory_updates = update_user_memories(username, user_info)
     
-    # Get user memory
-    user_memory = get_user_memory(username) if username != "guest" else {}
-    
-    # Get conversation history from database if not provided
+    # Get conversation history from database if not provided, no more than the budget can use
+    history_limit = history_fetch_limit()
     if not conversation_history and username != "guest":
-        conversation_history = get_conversation_history(username)
+        conversation_history = get_conversation_history(username, history_limit)
     elif not conversation_history:
         conversation_history = []
     
     # Prepare system message with context and user memory
-    system_message = "You are a helpful assistant for the PixelMind text encryption system. "
-    
-    # Add user memory to system message if available
-    if username != "guest" and user_memory:
-        system_message += "Here is what you know about the user:\n"
-        if user_memory.get("name"):
-            system_message += f"- Name: {user_memory['name']}\n"
-        if user_memory.get("place"):
-            system_message += f"- Location: {user_memory['place']}\n"
-        if user_memory.get("friends"):
-            system_message += f"- Friends: {', '.join(user_memory['friends'])}\n"
-        if user_memory.get("priorities"):
-            system_message += f"- Priorities: {', '.join(user_memory['priorities'])}\n"
-        if user_memory.get("preferences"):
-            system_message += "- Preferences:\n"
-            for pref, sentiment in user_memory["preferences"].items():
-                system_message += f"  - {pref}: {sentiment}\n"
-        if user_memory.get("other_info"):
-            system_message += "- Other Information:\n"
-            for key, value in user_memory["other_info"].items():
-                system_message += f"  - {key}: {value}\n"
-    
-    system_message += "\nWhen responding, make 1-4 important keywords in your response bold by surrounding them with ** (e.g., **keyword**). Choose only the most important words to emphasize. Keep your answers concise and helpful."
+    system_message = get_system_prompt(username, user_memory)
     
     # Debug print system message
     print(f"\033[96m[DEBUG]\033[0m System message: {system_message}")
     
-    # Prepare messages with history
+    # Prepare messages with the part of the history that fits the budget
+    history = trim_history(conversation_history[-history_limit:])
+    print(f"\033[96m[DEBUG]\033[0m Sending {len(history)} of {len(conversation_history)} history messages")
     messages = [{"role": "system", "content": system_message}]
-    
-    if conversation_history:
-        # Add previous exchanges to maintain context
-        for message in conversation_history[-100:]:
-            messages.append(message)
+    messages.extend(history)
     
     # Add current user message
     messages.append({"role": "user", "content": user_message})
@@ -110,7 +195,8 @@ def get_chatbot_response(user_message, conversation_history=None, username=None)
         
         print(f"\033[96m[DEBUG]\033[0m Making API request to: {api_url}")
         
-        response = requests.post(api_url, headers=headers, json=data)
+        # Pooled keep-alive connection, with timeouts, retries and a circuit breaker
+        response = chatbot_client.get_client().post(api_url, headers=headers, json=data)
         
         # Print response status for debugging
         print(f"\033[96m[DEBUG]\033[0m Response status: {response.status_code}")
@@ -125,11 +211,11 @@ def get_chatbot_response(user_message, conversation_history=None, username=None)
         
         # Store conversation in database if username is provided
         if username != "guest":
-            # Add user message to history
-            add_to_conversation_history(username, {"role": "user", "content": user_message})
-            
-            # Add bot response to history
-            add_to_conversation_history(username, {"role": "assistant", "content": bot_response})
+            # Add the user message and the bot response to history in one write
+            add_conversation_messages(username, [
+                {"role": "user", "content": user_message},
+                {"role": "assistant", "content": bot_response}
+            ])
         
         if memory_updates:
             memory_update_text = "**Memory Updated:**<br>"
@@ -199,6 +285,9 @@ def get_chatbot_response(user_message, conversation_history=None, username=None)
         bot_response = limit_bold_keywords(bot_response)
         
         return bot_response
+    except chatbot_client.CircuitOpenError as e:
+        print(f"\033[91m[ERROR]\033[0m {e}")
+        return "I'm sorry, the AI service is **temporarily** unavailable. Please try again in a minute."
     except requests.exceptions.RequestException as e:
         print(f"\033[91m[ERROR]\033[0m Request error calling API: {e}")
         return "I'm sorry, I **encountered** a network issue while connecting to the AI service. Please try again later."
@@ -0,0 +1,88 @@
+import os
+import bz2
+import lzma
+import zlib
+
+# Payload compressors, applied before the payload is packed into pixels.
+# The position in this tuple is the code stored in the image header, so only append to it.
+COMPRESSIONS = ('none', 'zlib', 'lzma', 'bz2')
+DEFAULT_COMPRESSION = os.environ.get('PAYLOAD_COMPRESSION', 'none')
+
+
+def compression_name(compression=None):
+    """Validated compressor name (DEFAULT_COMPRESSION when None)"""
+    name = compression or DEFAULT_COMPRESSION
+    if name not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{name}', expected one of {', '.join(COMPRESSIONS)}")
+    return name
+
+
+def compressor(compression):
+    """Incremental compressor object with compress()/flush(), or None for "none" """
+    if compression == 'zlib':
+        return zlib.compressobj(6)
+    if compression == 'lzma':
+        return lzma.LZMACompressor()
+    if compression == 'bz2':
+        return bz2.BZ2Compressor(9)
+    return None
+
+
+def decompressor(compression):
+    if compression == 'zlib':
+        return zlib.decompressobj()
+    if compression == 'lzma':
+        return lzma.LZMADecompressor()
+    if compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    return None
+
+
+def compress(data, compression):
+    if compression == 'zlib':
+        return zlib.compress(data, 6)
+    if compression == 'lzma':
+        return lzma.compress(data)
+    if compression == 'bz2':
+        return bz2.compress(data, 9)
+    return data
+
+
+def decompress(data, compression):
+    if compression == 'zlib':
+        return zlib.decompress(data)
+    if compression == 'lzma':
+        return lzma.decompress(data)
+    if compression == 'bz2':
+        return bz2.decompress(data)
+    return data
+
+
+def iter_compress(chunks, compression):
+    """Compress an iterable of byte chunks without holding more than one chunk at a time"""
+    engine = compressor(compression)
+    if engine is None:
+        yield from chunks
+        return
+    for chunk in chunks:
+        data = engine.compress(chunk)
+        if data:
+            yield data
+    data = engine.flush()
+    if data:
+        yield data
+
+
+def iter_decompress(chunks, compression):
+    engine = decompressor(compression)
+    if engine is None:
+        yield from chunks
+        return
+    for chunk in chunks:
+        data = engine.decompress(chunk)
+        if data:
+            yield data
+    if compression == 'zlib':
+        data = engine.flush()
+        if data:
+            yield data
@@ -1,35 +1,229 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import ConnectionFailure, BulkWriteError, DuplicateKeyError
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
-import sys
 import re
+import copy
+import datetime
+import atexit
+import threading
+from functools import lru_cache
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Connection pool of the shared client (per process); MongoDB driver defaults where unset
+MONGODB_DB_NAME = os.environ.get('MONGODB_DB_NAME', 'pixelmind_db')
+MONGODB_MAX_POOL_SIZE = int(os.environ.get('MONGODB_MAX_POOL_SIZE', 100))
+MONGODB_MIN_POOL_SIZE = int(os.environ.get('MONGODB_MIN_POOL_SIZE', 0))
+MONGODB_MAX_IDLE_TIME_MS = int(os.environ.get('MONGODB_MAX_IDLE_TIME_MS', 300000))
+# Timeouts in milliseconds: finding a server, opening a connection, a socket read/write
+# (0 = no limit) and waiting for a free connection when the pool is exhausted
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGODB_CONNECT_TIMEOUT_MS', 5000))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGODB_SOCKET_TIMEOUT_MS', 30000))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 10000))
+
+# Password hashing: a werkzeug method string with its cost, e.g. "scrypt:16384:8:1" or
+# "pbkdf2:sha256:600000". Once it is set, stored hashes made with other settings are replaced on the
+# user's next successful login. Unset, new hashes use werkzeug's default and stored ones are kept.
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or None
+# Passwords hashed or verified at once (per process). Hashing runs on the request's own thread;
+# beyond this many, requests wait for a free slot
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+
+# Messages kept in each user's conversation_history document; older ones are dropped, or moved to
+# conversation_archive (one document per user and day) when CONVERSATION_ARCHIVE is on
+CONVERSATION_HISTORY_LIMIT = int(os.environ.get('CONVERSATION_HISTORY_LIMIT', 100))
+CONVERSATION_ARCHIVE = os.environ.get('CONVERSATION_ARCHIVE', '').lower() in ('1', 'true', 'yes')
+
+# MongoDB's error code for a write rejected by a unique index
+DUPLICATE_KEY_ERROR = 11000
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+_hash_slots = None
+_hash_slots_pid = None
+_hash_slots_lock = threading.Lock()
+
+
 # MongoDB connection
+def get_client():
+    """
+    Return the process-wide MongoClient, creating it on first use (and again
+    after a fork, since a client must not be shared with a child process).
+    The client keeps a pool of connections and reconnects on its own when the
+    server comes back, so it is created once and never pinged per call.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            mongodb_uri = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017')
+            # connect=False defers connecting to the first operation, so creating the client never blocks
+            _client = MongoClient(
+                mongodb_uri,
+                connect=False,
+                maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                minPoolSize=MONGODB_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS,
+                serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS or None,
+                waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+            )
+            _client_pid = os.getpid()
+            print(f"\033[92m[INFO]\033[0m Created MongoDB client (pool of up to {MONGODB_MAX_POOL_SIZE} connections)")
+        return _client
+
 def get_db():
+    """Return the application database on the shared client"""
+    return get_client()[MONGODB_DB_NAME]
+
+def reset_client():
+    """Close this process's client so the next call creates a fresh one"""
+    global _client
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+
+def check_connection():
     """
-    Establish connection to MongoDB and return database object
-    Prints connection status to console
+    Readiness check: ping the server through the shared client.
+    Returns tuple (is_ready, message)
     """
     try:
-        # Get MongoDB connection string from environment variable
-        mongodb_uri = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017')
-        client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=5000)  # 5 second timeout
-        
-        # Test the connection
-        client.admin.command('ping')
-        print("\033[92m[SUCCESS]\033[0m MongoDB connection established successfully!")
-        
-        db = client.pixelmind_db
-        return db
-    
+        get_client().admin.command('ping')
+        return True, "MongoDB connection is ready"
     except Exception as e:
-        print(f"\033[91m[ERROR]\033[0m MongoDB connection failed: {str(e)}")
-        print("Make sure MongoDB is running and the connection string is correct.")
-        sys.exit(1)  # Exit the application if database connection fails
+        print(f"\033[91m[ERROR]\033[0m MongoDB ping failed: {str(e)}")
+        return False, f"MongoDB is unavailable: {type(e).__name__}"
+
+# Password hashing
+def get_hash_slots():
+    """Return the process-wide semaphore capping concurrent password hashes (recreated after a fork)"""
+    global _hash_slots, _hash_slots_pid
+    with _hash_slots_lock:
+        if _hash_slots is None or _hash_slots_pid != os.getpid():
+            _hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS)
+            _hash_slots_pid = os.getpid()
+        return _hash_slots
+
+def hash_password(password):
+    """Hash a password with PASSWORD_HASH_METHOD (werkzeug's default when unset), at most PASSWORD_HASH_WORKERS at once"""
+    with get_hash_slots():
+        if PASSWORD_HASH_METHOD:
+            return generate_password_hash(password, PASSWORD_HASH_METHOD)
+        return generate_password_hash(password)
+
+def check_password(pwhash, password):
+    """
+    check_password_hash, at most PASSWORD_HASH_WORKERS at once. It blocks the
+    calling thread for the whole hash; the cap only keeps a login spike from
+    running more hashes than there are cores (scrypt and PBKDF2 release the GIL)
+    """
+    with get_hash_slots():
+        return check_password_hash(pwhash, password)
+
+@lru_cache(maxsize=None)
+def password_hash_prefix(method):
+    """The "method:params" part of hashes made with method, with werkzeug's defaults filled in"""
+    return generate_password_hash('', method).split('$', 1)[0]
+
+def needs_rehash(pwhash):
+    """
+    Whether a stored hash was made with a different method or cost than
+    PASSWORD_HASH_METHOD; never when it is unset, so hashes are only rewritten
+    after a method has been chosen explicitly
+    """
+    if not PASSWORD_HASH_METHOD:
+        return False
+    return pwhash.split('$', 1)[0] != password_hash_prefix(PASSWORD_HASH_METHOD)
+
+# Close the pool's connections on exit
+atexit.register(reset_client)
+
+# Indexes behind every query the app runs: (collection, keys, options). One user, memory and
+# history document per username, so those are unique; activity is listed per user (optionally per
+# action type), newest first, with _id ordering events that share a timestamp.
+INDEXES = [
+    ("users", [("username", ASCENDING)], {"name": "username_unique", "unique": True}),
+    ("users", [("email", ASCENDING)], {"name": "email_unique", "unique": True}),
+    ("activity_logs", [("username", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+     {"name": "username_timestamp_desc"}),
+    ("activity_logs", [("username", ASCENDING), ("action_type", ASCENDING), ("timestamp", DESCENDING),
+                       ("_id", DESCENDING)], {"name": "username_action_timestamp_desc"}),
+    ("user_memory", [("username", ASCENDING)], {"name": "username_unique", "unique": True}),
+    ("conversation_history", [("username", ASCENDING)], {"name": "username_unique", "unique": True}),
+    ("conversation_archive", [("username", ASCENDING), ("day", DESCENDING)],
+     {"name": "username_day_unique", "unique": True}),
+]
+
+def ensure_indexes():
+    """
+    Create the indexes in INDEXES. Idempotent: an index that already exists
+    with the same keys and options is left alone. One failure (e.g. duplicate
+    usernames preventing a unique index) does not stop the others; an
+    unreachable server raises ConnectionFailure.
+    Returns a list of (collection, index_name, error_or_None) tuples.
+    """
+    db = get_db()
+    results = []
+    for collection, keys, options in INDEXES:
+        try:
+            db[collection].create_index(keys, **options)
+            results.append((collection, options["name"], None))
+        except ConnectionFailure:
+            raise  # MongoDB is unreachable, so every other index would fail the same way
+        except Exception as e:
+            print(f"\033[91m[ERROR]\033[0m Could not create index {collection}.{options['name']}: {str(e)}")
+            results.append((collection, options["name"], f"{type(e).__name__}: {e}"))
+    created = sum(1 for _, _, error in results if error is None)
+    print(f"\033[92m[INFO]\033[0m Ensured {created} of {len(INDEXES)} MongoDB indexes")
+    return results
+
+def hot_queries(username, email):
+    """The app's frequent queries as (description, cursor) pairs, for explain()"""
+    db = get_db()
+    return [
+        ("users by username (login, Google sign-up)", db.users.find({"username": username}).limit(1)),
+        ("users by email (login, registration, Google sign-in)", db.users.find({"email": email}).limit(1)),
+        ("activity_logs by username, newest first (activity page)",
+         db.activity_logs.find({"username": username}).sort([("timestamp", -1), ("_id", -1)]).limit(51)),
+        ("activity_logs by username and action, newest first (filtered activity page)",
+         db.activity_logs.find({"$and": [{"username": username}, {"action_type": "encrypt"}]})
+         .sort([("timestamp", -1), ("_id", -1)]).limit(51)),
+        ("user_memory by username (chatbot)", db.user_memory.find({"username": username}).limit(1)),
+        ("conversation_history by username (chatbot)", db.conversation_history.find({"username": username}).limit(1)),
+    ]
+
+def plan_nodes(plan):
+    """The nodes of a query plan tree, from the root down"""
+    plan = plan.get("queryPlan", plan)  # Slot-based engine plans wrap the classic plan tree
+    yield plan
+    children = [plan["inputStage"]] if "inputStage" in plan else []
+    for child in children + plan.get("inputStages", []):
+        yield from plan_nodes(child)
+
+def explain_query(cursor):
+    """
+    Summary of cursor.explain(): the winning plan's stages (COLLSCAN means a
+    collection scan), the indexes it uses and how much it examined
+    """
+    explanation = cursor.explain()
+    nodes = list(plan_nodes(explanation["queryPlanner"]["winningPlan"]))
+    stats = explanation.get("executionStats", {})
+    return {
+        "stages": [node.get("stage", "?") for node in nodes],
+        "indexes": [node["indexName"] for node in nodes if "indexName" in node],
+        "returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "time_ms": stats.get("executionTimeMillis"),
+    }
 
 def validate_password(password):
     """
@@ -74,12 +268,19 @@ def create_user(username, password, email):
     # Create new user with hashed password
     user = {
         "username": username,
-        "password": generate_password_hash(password),
+        "password": hash_password(password),
         "email": email,
         "auth_type": "local"  # Regular local account
     }
     
-    db.users.insert_one(user)
+    # A concurrent signup (e.g. a double-submitted form) can take the name between the checks above
+    # and the insert; the unique indexes reject the second insert
+    try:
+        db.users.insert_one(user)
+    except DuplicateKeyError:
+        if db.users.find_one({"username": username}):
+            return False, "Username already exists"
+        return False, "Email already exists"
     print(f"\033[92m[SUCCESS]\033[0m User '{username}' created successfully")
     return True, "User created successfully"
 
@@ -104,12 +305,18 @@ def create_google_user(username, password, email):
     # Create new user with Google auth
     user = {
         "username": username,
-        "password": generate_password_hash(password),  # Store a random password
+        "password": hash_password(password),  # Store a random password
         "email": email,
         "auth_type": "google"  # Mark as Google authenticated
     }
     
-    db.users.insert_one(user)
+    # A concurrent sign-in with the same Google account may have created the user meanwhile
+    try:
+        db.users.insert_one(user)
+    except DuplicateKeyError:
+        if db.users.find_one({"email": email}):
+            return True, "User already exists"
+        return False, "Username already exists"
     print(f"\033[92m[SUCCESS]\033[0m Google user '{username}' created successfully")
     return True, "User created successfully"
 
@@ -137,136 +344,188 @@ def validate_user(username, password):
     else:
         user = db.users.find_one({"username": username})
     
-    if user and check_password_hash(user["password"], password):
+    if user and check_password(user["password"], password):
         print(f"\033[92m[SUCCESS]\033[0m Login successful for user '{user['username']}'")
+        
+        # Bring the stored hash to the configured method and cost while the password is at hand;
+        # the filter on the old hash keeps a concurrent password change from being overwritten
+        if needs_rehash(user["password"]):
+            new_hash = hash_password(password)
+            db.users.update_one(
+                {"_id": user["_id"], "password": user["password"]},
+                {"$set": {"password": new_hash}}
+            )
+            user["password"] = new_hash
+            print(f"\033[92m[INFO]\033[0m Rehashed password for user '{user['username']}' with {PASSWORD_HASH_METHOD}")
         return True, user
     
     print(f"\033[93m[WARNING]\033[0m Failed login attempt for username/email '{username}'")
     return False, None
 
 # User memory functions
+# Fields of a new memory document; list fields collect values, dict fields map keys to values
+MEMORY_DEFAULTS = {
+    "name": "",
+    "place": "",
+    "friends": [],
+    "priorities": [],
+    "preferences": {},
+    "other_info": {}
+}
+
 def get_user_memory(username):
     """Get user memory from database"""
     db = get_db()
     memory = db.user_memory.find_one({"username": username})
     
     if not memory:
-        # Initialize empty memory if none exists
-        memory = {
-            "username": username,
-            "name": "",
-            "place": "",
-            "friends": [],
-            "priorities": [],
-            "preferences": {},
-            "other_info": {}
-        }
-        db.user_memory.insert_one(memory)
+        # Initialize empty memory if none exists; an upsert, so a concurrent first message of the
+        # same user gets the same document instead of a duplicate key error
+        memory = db.user_memory.find_one_and_update(
+            {"username": username},
+            {"$setOnInsert": copy.deepcopy(MEMORY_DEFAULTS)},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
         print(f"\033[92m[INFO]\033[0m Created new memory for user '{username}'")
     
     return memory
 
-def update_user_memory(username, memory_type, value):
-    """Update a specific type of user memory"""
-    db = get_db()
-    
-    # Debug print
-    print(f"\033[96m[DEBUG]\033[0m Updating memory for {username}: {memory_type} = {value}")
-    
-    # Get current memory
-    memory = get_user_memory(username)
-    
-    # Update the specific memory type
+def memory_update(memory_type, value):
+    """
+    How one extracted fact changes the memory document: returns tuple
+    (operator, field, description), or None for an unknown memory_type
+    """
     if memory_type == "name":
-        db.user_memory.update_one(
-            {"username": username},
-            {"$set": {"name": value}}
-        )
-        print(f"\033[92m[SUCCESS]\033[0m Updated name for {username} to '{value}'")
-        return f"name: {value}"
-    
-    elif memory_type == "place":
-        db.user_memory.update_one(
-            {"username": username},
-            {"$set": {"place": value}}
-        )
-        print(f"\033[92m[SUCCESS]\033[0m Updated place for {username} to '{value}'")
-        return f"place: {value}"
-    
-    elif memory_type == "friends":
+        return "$set", "name", f"name: {value}"
+    if memory_type == "place":
+        return "$set", "place", f"place: {value}"
+    if memory_type == "friends":
         # Add to friends list if not already present
-        if value not in memory.get("friends", []):
-            db.user_memory.update_one(
-                {"username": username},
-                {"$push": {"friends": value}}
-            )
-            print(f"\033[92m[SUCCESS]\033[0m Added friend '{value}' for {username}")
-        return f"friend: {value}"
-    
-    elif memory_type == "priorities":
+        return "$addToSet", "friends", f"friend: {value}"
+    if memory_type == "priorities":
         # Add to priorities list if not already present
-        if value not in memory.get("priorities", []):
-            db.user_memory.update_one(
-                {"username": username},
-                {"$push": {"priorities": value}}
-            )
-            print(f"\033[92m[SUCCESS]\033[0m Added priority '{value}' for {username}")
-        return f"priority: {value}"
-    
-    elif memory_type.startswith("preferences."):
-        # Extract the preference key
+        return "$addToSet", "priorities", f"priority: {value}"
+    if memory_type.startswith("preferences."):
         pref_key = memory_type.split(".", 1)[1]
-        db.user_memory.update_one(
-            {"username": username},
-            {"$set": {f"preferences.{pref_key}": value}}
-        )
-        print(f"\033[92m[SUCCESS]\033[0m Updated preference {pref_key}='{value}' for {username}")
-        return f"preference: {pref_key} = {value}"
-    
-    elif memory_type.startswith("other_info."):
-        # Extract the info key
+        return "$set", memory_type, f"preference: {pref_key} = {value}"
+    if memory_type.startswith("other_info."):
         info_key = memory_type.split(".", 1)[1]
-        db.user_memory.update_one(
-            {"username": username},
-            {"$set": {f"other_info.{info_key}": value}}
-        )
-        print(f"\033[92m[SUCCESS]\033[0m Updated information {info_key}='{value}' for {username}")
-        return f"information: {info_key} = {value}"
-    
+        return "$set", memory_type, f"information: {info_key} = {value}"
     return None
 
+def update_user_memories(username, updates):
+    """
+    Apply every (memory_type, value) fact extracted from a message in one
+    atomic find_one_and_update: $set for single values and keyed entries,
+    $addToSet with $each for list entries, creating the memory document if
+    it is missing (upsert), and increments its version. Returns tuple
+    (memory, descriptions): the updated document and one description per
+    change it applies (a repeated fact is applied, and described, once).
+    """
+    changes = {"$set": {}, "$addToSet": {}}
+    # Keyed by what the change writes, so duplicates collapse like they do in the update
+    applied = {}
+    for memory_type, value in updates:
+        update = memory_update(memory_type, value)
+        if update is None:
+            continue
+        operator, field, description = update
+        if operator == "$addToSet":
+            values = changes["$addToSet"].setdefault(field, {"$each": []})["$each"]
+            if value not in values:
+                values.append(value)
+            applied[(field, value)] = description
+        else:
+            changes["$set"][field] = value
+            applied[field] = description
+    descriptions = list(applied.values())
+
+    if not descriptions:
+        return get_user_memory(username), []
+
+    # A new document starts from the defaults, except for the fields this update writes
+    touched = {field.split(".", 1)[0] for operator in changes.values() for field in operator}
+    changes["$setOnInsert"] = {field: default for field, default in MEMORY_DEFAULTS.items() if field not in touched}
+    # Every write bumps the version, which tells caches built from the memory that it changed
+    changes["$inc"] = {"version": 1}
+    update_document = {operator: fields for operator, fields in changes.items() if fields}
+
+    print(f"\033[96m[DEBUG]\033[0m Updating memory for {username}: {update_document}")
+    memory = get_db().user_memory.find_one_and_update(
+        {"username": username},
+        update_document,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    print(f"\033[92m[SUCCESS]\033[0m Updated memory for {username}: {', '.join(descriptions)}")
+    return memory, descriptions
+
+def update_user_memory(username, memory_type, value):
+    """Update a specific type of user memory"""
+    _, descriptions = update_user_memories(username, [(memory_type, value)])
+    return descriptions[0] if descriptions else None
+
 # Conversation history functions
-def get_conversation_history(username):
-    """Get conversation history for a user"""
-    db = get_db()
-    history = db.conversation_history.find_one({"username": username})
-    
-    if not history:
-        # Initialize empty history if none exists
-        history = {
-            "username": username,
-            "messages": []
-        }
-        db.conversation_history.insert_one(history)
-    
-    return history.get("messages", [])
+def get_conversation_history(username, max_messages=None):
+    """
+    Get the last max_messages messages (CONVERSATION_HISTORY_LIMIT when None)
+    of a user's conversation history. The $slice projection leaves older
+    messages on the server.
+    """
+    if max_messages is None:
+        max_messages = CONVERSATION_HISTORY_LIMIT
+    if max_messages <= 0:
+        return []
+    history = get_db().conversation_history.find_one(
+        {"username": username},
+        {"_id": 0, "messages": {"$slice": -max_messages}}
+    )
+    # No document yet: add_conversation_messages() creates it with the first turn
+    return history.get("messages", []) if history else []
 
-def add_to_conversation_history(username, message):
-    """Add a message to the conversation history"""
+def add_conversation_messages(username, messages):
+    """
+    Append messages (e.g. a whole turn: the user's message and the reply) to
+    the conversation history in one atomic $push with $each and $slice, which
+    also keeps only the last CONVERSATION_HISTORY_LIMIT messages. With
+    CONVERSATION_ARCHIVE on, the messages cut off are moved to the archive.
+    """
     db = get_db()
-    
-    # Add message to history
-    db.conversation_history.update_one(
+    update = {"$push": {"messages": {"$each": list(messages), "$slice": -CONVERSATION_HISTORY_LIMIT}}}
+
+    if not CONVERSATION_ARCHIVE:
+        # upsert creates the document if it doesn't exist
+        db.conversation_history.update_one({"username": username}, update, upsert=True)
+        return
+
+    # The messages before the update tell which ones the $slice cut off
+    previous = db.conversation_history.find_one_and_update(
         {"username": username},
-        {"$push": {"messages": message}},
-        upsert=True  # Create the document if it doesn't exist
+        update,
+        projection={"_id": 0, "messages": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
     )
-    
-    # Limit history to 100 messages
-    db.conversation_history.update_one(
-        {"username": username},
-        {"$push": {"messages": {"$each": [], "$slice": -100}}}
+    previous_messages = previous.get("messages", []) if previous else []
+    overflow = len(previous_messages) + len(messages) - CONVERSATION_HISTORY_LIMIT
+    if overflow > 0:
+        archive_conversation_messages(username, previous_messages[:overflow])
+
+def archive_conversation_messages(username, messages, day=None):
+    """Append messages to the user's conversation_archive document of the day they are archived"""
+    if day is None:
+        day = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    get_db().conversation_archive.update_one(
+        {"username": username, "day": day},
+        {"$push": {"messages": {"$each": list(messages)}}, "$inc": {"count": len(messages)}},
+        upsert=True
     )
+    print(f"\033[92m[INFO]\033[0m Archived {len(messages)} conversation messages of '{username}'")
+
+def add_to_conversation_history(username, message):
+    """Add a message to the conversation history"""
+    add_conversation_messages(username, [message])
 
 def extract_user_info(text):
     """
@@ -365,31 +624,39 @@ def log_user_activity(username, action_type, filename, timestamp=None):
     """
     Log user activity in the database
     action_type: 'encrypt' or 'decrypt'
+    The event is queued and written in a batch by activity_log's background
+    thread, so the request does not wait for MongoDB.
+    """
+    import activity_log
+
+    return activity_log.log(username, action_type, filename, timestamp)
+
+def insert_activities(activities):
+    """
+    Write a batch of activity events with one unordered insert_many and return
+    the events that were not written. insert_many gives each event dict an _id,
+    which a retry of the same dicts keeps, so an event that an earlier, partly
+    failed attempt already wrote is rejected as a duplicate key and counts as
+    written. Connection errors are raised.
     """
-    import datetime
-    
     db = get_db()
-    
-    # Use current time if timestamp not provided
-    if timestamp is None:
-        timestamp = datetime.datetime.now()
-    
-    activity = {
-        "username": username,
-        "action_type": action_type,
-        "filename": filename,
-        "timestamp": timestamp
-    }
-    
-    db.activity_logs.insert_one(activity)
-    print(f"\033[92m[SUCCESS]\033[0m Logged {action_type} activity for user '{username}'")
-    return True
+    try:
+        db.activity_logs.insert_many(activities, ordered=False)
+    except BulkWriteError as e:
+        return [activities[error["index"]] for error in e.details.get("writeErrors", [])
+                if error.get("code") != DUPLICATE_KEY_ERROR]
+    return []
 
 def get_user_activities(username=None, limit=50):
     """
     Retrieve user activities from database
     If username is None, get activities for all users
     """
+    import activity_log
+
+    # Write this process's queued events first, so a user sees what they just did
+    activity_log.flush()
+
     db = get_db()
     
     # Query based on username or get all activities
@@ -405,3 +672,70 @@ def get_user_activities(username=None, limit=50):
     ).sort("timestamp", -1).limit(limit))
     
     return activities
+
+def encode_activity_cursor(activity):
+    """Opaque cursor pointing just after an activity: its timestamp and _id"""
+    import base64
+
+    raw = f"{activity['timestamp'].isoformat()}|{activity['_id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_activity_cursor(cursor):
+    """Inverse of encode_activity_cursor; raises ValueError for a malformed cursor"""
+    import base64
+    import binascii
+    import datetime
+    from bson import ObjectId
+    from bson.errors import InvalidId
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        timestamp, _, object_id = raw.partition('|')
+        return datetime.datetime.fromisoformat(timestamp), ObjectId(object_id)
+    except (binascii.Error, UnicodeDecodeError, InvalidId, ValueError):
+        raise ValueError("Invalid activity cursor")
+
+def get_activity_page(username=None, limit=50, cursor=None, action_type=None, start=None, end=None):
+    """
+    One page of activities, newest first, using keyset pagination on
+    (timestamp, _id): the page after `cursor` starts right below the last
+    activity of the previous page through the index, so every page costs the
+    same however far back it is. Filters: action_type ('encrypt' or
+    'decrypt') and a timestamp range, start inclusive and end exclusive.
+    Returns tuple (activities, next_cursor); next_cursor is None on the last page.
+    """
+    import activity_log
+
+    # Write this process's queued events first, so a user sees what they just did
+    if cursor is None:
+        activity_log.flush()
+
+    db = get_db()
+
+    conditions = []
+    if username:
+        conditions.append({"username": username})
+    if action_type:
+        conditions.append({"action_type": action_type})
+    if start or end:
+        timestamp_range = {}
+        if start:
+            timestamp_range["$gte"] = start
+        if end:
+            timestamp_range["$lt"] = end
+        conditions.append({"timestamp": timestamp_range})
+    if cursor:
+        after_timestamp, after_id = decode_activity_cursor(cursor)
+        conditions.append({"$or": [
+            {"timestamp": {"$lt": after_timestamp}},
+            {"timestamp": after_timestamp, "_id": {"$lt": after_id}},
+        ]})
+    query = {"$and": conditions} if conditions else {}
+
+    # One extra activity tells whether there is a next page
+    activities = list(db.activity_logs.find(query).sort([("timestamp", -1), ("_id", -1)]).limit(limit + 1))
+    next_cursor = encode_activity_cursor(activities[limit - 1]) if len(activities) > limit else None
+    activities = activities[:limit]
+    for activity in activities:
+        del activity["_id"]
+    return activities, next_cursor
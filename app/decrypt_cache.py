@@ -0,0 +1,170 @@
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Get the project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Decrypted results are cached in memory (per process) and on disk (shared by all workers)
+CACHE_DIR = os.environ.get('DECRYPT_CACHE_DIR', os.path.join(PROJECT_ROOT, 'temp', 'decrypt_cache'))
+MEMORY_LIMIT_BYTES = int(os.environ.get('DECRYPT_CACHE_MEMORY_BYTES', 64 * 1024 * 1024))
+DISK_LIMIT_BYTES = int(os.environ.get('DECRYPT_CACHE_DISK_BYTES', 1024 * 1024 * 1024))
+
+# Entries larger than this fraction of the memory tier only go to disk
+MAX_MEMORY_ENTRY_FRACTION = 8
+
+_lock = threading.Lock()
+_memory = OrderedDict()
+_memory_bytes = 0
+_disk_bytes = None  # Computed on first use
+_stats = {
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "memory_evictions": 0,
+    "disk_evictions": 0,
+}
+
+
+def cache_key(image_bytes):
+    """Key of a decrypted result: the SHA-256 of the image extracted from the PDF (its decoded pixels)"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _disk_path(key):
+    return os.path.join(CACHE_DIR, key[:2], key)
+
+
+def _remember(key, value):
+    """Insert into the in-memory LRU tier, evicting the least recently used entries. Caller holds _lock."""
+    global _memory_bytes
+    if MEMORY_LIMIT_BYTES <= 0 or len(value) > MEMORY_LIMIT_BYTES // MAX_MEMORY_ENTRY_FRACTION:
+        return
+    if key in _memory:
+        _memory.move_to_end(key)
+        return
+    _memory[key] = value
+    _memory_bytes += len(value)
+    while _memory_bytes > MEMORY_LIMIT_BYTES:
+        _, evicted = _memory.popitem(last=False)
+        _memory_bytes -= len(evicted)
+        _stats["memory_evictions"] += 1
+
+
+def get(key):
+    """Return the cached decrypted bytes for key, or None"""
+    with _lock:
+        value = _memory.get(key)
+        if value is not None:
+            _memory.move_to_end(key)
+            _stats["memory_hits"] += 1
+            return value
+
+    path = _disk_path(key)
+    try:
+        with open(path, 'rb') as f:
+            value = f.read()
+        os.utime(path)  # Mark as recently used for disk eviction
+    except OSError:
+        with _lock:
+            _stats["misses"] += 1
+        return None
+
+    with _lock:
+        _stats["disk_hits"] += 1
+        _remember(key, value)
+    return value
+
+
+def put(key, value):
+    """Cache the decrypted bytes for key in both tiers"""
+    global _disk_bytes
+    with _lock:
+        _remember(key, value)
+        _stats["stores"] += 1
+
+    if DISK_LIMIT_BYTES <= 0 or len(value) > DISK_LIMIT_BYTES:
+        return
+
+    path = _disk_path(key)
+    if os.path.exists(path):
+        return
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{key}.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"\033[93m[WARNING]\033[0m Could not write decrypt cache entry: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return
+
+    with _lock:
+        if _disk_bytes is None:
+            _disk_bytes = _scan_disk()[1]
+        else:
+            _disk_bytes += len(value)
+        over_limit = _disk_bytes > DISK_LIMIT_BYTES
+    if over_limit:
+        _evict_disk()
+
+
+def _scan_disk():
+    """Return ([(mtime, size, path), ...], total_bytes) for the disk tier"""
+    entries = []
+    total = 0
+    if not os.path.isdir(CACHE_DIR):
+        return entries, total
+    for bucket in os.scandir(CACHE_DIR):
+        if not bucket.is_dir():
+            continue
+        for entry in os.scandir(bucket.path):
+            if entry.name.startswith('.'):
+                continue  # Write in progress
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    return entries, total
+
+
+def _evict_disk():
+    """Remove the least recently used files until the disk tier is back to 90% of its limit"""
+    global _disk_bytes
+    entries, total = _scan_disk()
+    target = DISK_LIMIT_BYTES * 9 // 10
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue  # Already evicted by another worker
+        total -= size
+        evicted += 1
+    with _lock:
+        _disk_bytes = total
+        _stats["disk_evictions"] += evicted
+
+
+def stats():
+    """Hit/miss counters and tier sizes for this process"""
+    with _lock:
+        result = dict(_stats)
+        result["memory_entries"] = len(_memory)
+        result["memory_bytes"] = _memory_bytes
+        result["memory_limit_bytes"] = MEMORY_LIMIT_BYTES
+        result["disk_bytes"] = _disk_bytes
+        result["disk_limit_bytes"] = DISK_LIMIT_BYTES
+    lookups = result["memory_hits"] + result["disk_hits"] + result["misses"]
+    result["hit_rate"] = (result["memory_hits"] + result["disk_hits"]) / lookups if lookups else 0.0
+    return result
@@ -1,3 +1,6 @@
+import io
+from contextlib import contextmanager
+
 def text_to_binary(input_file, output_file):
     with open(input_file, 'r', encoding='utf-8') as file:
         text = file.read()
@@ -165,4 +168,119 @@ def remove_last_letter(input_file, output_file):
     except Exception as e:
         print(f"Error in remove_last_letter: {str(e)}")
         # Create empty output file if processing fails
-        open(output_file, 'w', encoding="utf-8").close()
\ No newline at end of file
+        open(output_file, 'w', encoding="utf-8").close()
+
+@contextmanager
+def open_text(input_file):
+    """
+    Read a path, or a binary file object such as an upload stream, as UTF-8
+    text with universal newlines, the same as open(input_file, 'r'). A file
+    object is left open.
+    """
+    if hasattr(input_file, 'read'):
+        file = io.TextIOWrapper(input_file, encoding='utf-8')
+        try:
+            yield file
+        finally:
+            file.detach()
+    else:
+        with open(input_file, 'r', encoding='utf-8') as file:
+            yield file
+
+
+def text_to_payload(input_file):
+    """
+    In-memory equivalent of text_to_binary followed by binary_to_ascii.
+    Returns the byte values that the two-stage chain writes to its output file.
+    input_file is a path or a binary file object.
+    """
+    with open_text(input_file) as file:
+        text = file.read()
+
+    try:
+        # Every code point fits in 8 bits, so the bit string is just the Latin-1 bytes
+        payload = text.encode('latin-1')
+    except UnicodeEncodeError:
+        # Code points above 255 widen past 8 bits in text_to_binary and shift every
+        # following byte, so rebuild that exact bit stream instead
+        binary = ''.join(format(ord(char), '08b') for char in text)
+        binary += '0' * (-len(binary) % 8)
+        payload = int(binary, 2).to_bytes(len(binary) // 8, 'big')
+
+    print(f"Converted text to payload, length: {len(payload)} bytes")
+    return payload
+
+
+def payload_to_text(payload):
+    """
+    In-memory equivalent of rgb_binary_de, join_lines_with_space, de_bin_to_text
+    and remove_last_letter. Returns the text that chain writes to its final file.
+    """
+    # de_bin_to_text maps each 8-bit value to chr(value), i.e. Latin-1
+    text = payload.decode('latin-1')
+
+    # remove_last_letter reads its input in text mode, which applies universal newlines
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+    print(f"Converted payload to text, text length: {len(text)}")
+
+    # Drop the last character exactly like remove_last_letter
+    return text[:-1]
+
+
+def iter_text_payload(input_file, chunk_size=1 << 20):
+    """
+    Chunked version of text_to_payload: yields the same bytes a piece at a time
+    while reading at most chunk_size characters of the file at once.
+    """
+    # Bits left over when a code point above 255 knocks the stream off byte alignment
+    carry = ''
+
+    with open_text(input_file) as file:
+        while True:
+            text = file.read(chunk_size)
+            if not text:
+                break
+
+            if not carry:
+                try:
+                    yield text.encode('latin-1')
+                    continue
+                except UnicodeEncodeError:
+                    pass
+
+            binary = carry + ''.join(format(ord(char), '08b') for char in text)
+            usable = len(binary) - len(binary) % 8
+            carry = binary[usable:]
+            if usable:
+                yield int(binary[:usable], 2).to_bytes(usable // 8, 'big')
+
+    if carry:
+        yield int(carry + '0' * (8 - len(carry)), 2).to_bytes(1, 'big')
+
+
+def iter_payload_text(payload_chunks):
+    """
+    Chunked version of payload_to_text: yields the decoded text a piece at a
+    time, holding back only the characters needed to handle a CRLF split across
+    chunks and the final character that remove_last_letter drops.
+    """
+    held = ''
+    for chunk in payload_chunks:
+        text = held + chunk.decode('latin-1')
+        if '\r' in text:
+            # A trailing CR may be the first half of a CRLF, so keep it back
+            keep_cr = text.endswith('\r')
+            if keep_cr:
+                text = text[:-1]
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+            if keep_cr:
+                text += '\r'
+
+        # Always hold back the last character: it is either a pending CR or possibly the final one
+        held = text[-1:]
+        if len(text) > 1:
+            yield text[:-1]
+
+    # Whatever is held back is the last character, which the original pipeline drops
@@ -1,7 +1,43 @@
 from PIL import Image
+import io
 import random
 import os
 import struct
+import tempfile
+import zlib
+
+# Named PNG encoding profiles.
+# "filter" is the scanline filter: "none" writes unfiltered rows through png_stream, which suits
+# byte payloads such as text best; "adaptive" lets Pillow pick a filter per row. "compress_level"
+# and "strategy" are the zlib settings (None keeps Pillow's, or zlib's, own default); "optimize"
+# asks Pillow for its extra optimization pass.
+PNG_PROFILES = {
+    # Fastest save, still far smaller than the raw payload
+    'fast': {'filter': 'none', 'compress_level': 1, 'strategy': zlib.Z_DEFAULT_STRATEGY, 'optimize': False},
+    # Pillow's defaults, byte for byte what ascii_to_rgb has always written
+    'default': {'filter': 'adaptive', 'compress_level': None, 'strategy': None, 'optimize': False},
+    # Smallest files, for archival PDFs
+    'compact': {'filter': 'none', 'compress_level': 9, 'strategy': zlib.Z_DEFAULT_STRATEGY, 'optimize': False},
+}
+DEFAULT_PNG_PROFILE = os.environ.get('PNG_PROFILE', 'default')
+
+# Size of the slices handed to the PNG writer, so it never copies a whole pixel buffer at once
+WRITE_CHUNK_SIZE = 1 << 20
+
+# Extended image header, see pack_header()
+EXTENDED_HEADER_BIT = 0x80000000
+HEADER_VERSION = 1
+FLAG_RAW = 0x01   # The payload is the file's exact bytes (bytes codec), not legacy text
+FLAG_NAME = 0x02  # The original file name follows the flags byte
+COMPRESSION_SHIFT = 2
+COMPRESSION_MASK = 0x0c  # Index into compression.COMPRESSIONS of the payload's compressor
+FLAG_SHARD = 0x10  # The image is one shard of a set: set id, index and count follow the name
+
+# Sharded mode: no shard image is wider or taller than this
+SHARD_MAX_DIMENSION = int(os.environ.get('SHARD_MAX_DIMENSION', 2048))
+
+# Codecs accepted by encrypt_file: "text" is the original character pipeline, "bytes" works for any file
+CODECS = ('text', 'bytes')
 
 def ascii_to_rgb(rgb_file, image_name):
     colors = []
@@ -55,6 +91,200 @@ def ascii_to_rgb(rgb_file, image_name):
     
     return image_name
 
+def image_dimensions(total_values):
+    """Square-ish width x height that holds total_values channel values, as in ascii_to_rgb"""
+    total_pixels = (total_values + (-total_values % 3)) // 3
+
+    width = int(total_pixels ** 0.5)
+    height = (total_pixels + width - 1) // width  # Ceiling division
+
+    return width, height
+
+def pack_header(payload_length, flags=0, name=None, shard=None):
+    """
+    Header stored in front of the payload. Without flags or a name it is the
+    plain 4-byte big-endian length written by ascii_to_rgb. Otherwise the top
+    bit of the length word is set (a legacy image would need a 2 GiB payload
+    for that) and a version byte, a flags byte, an optional UTF-8 file name and
+    optional shard fields follow. shard is a (set_id, index, count) tuple with
+    a 16-byte set_id.
+    """
+    if not flags and name is None and shard is None:
+        return struct.pack('>I', payload_length)
+    if payload_length >= EXTENDED_HEADER_BIT:
+        raise ValueError("Payload too large for a single image")
+
+    if name is not None:
+        flags |= FLAG_NAME
+    if shard is not None:
+        flags |= FLAG_SHARD
+    header = struct.pack('>IBB', EXTENDED_HEADER_BIT | payload_length, HEADER_VERSION, flags)
+    if name is not None:
+        encoded_name = name.encode('utf-8')[:0xffff]
+        header += struct.pack('>H', len(encoded_name)) + encoded_name
+    if shard is not None:
+        header += struct.pack('>16sII', *shard)
+    return header
+
+def compression_flags(compression=None):
+    """Header flag bits recording the payload's compressor"""
+    from compression import COMPRESSIONS, compression_name
+
+    return COMPRESSIONS.index(compression_name(compression)) << COMPRESSION_SHIFT
+
+def header_compression(header):
+    """Name of the compressor recorded in a parsed header ("none" for legacy images)"""
+    from compression import COMPRESSIONS
+
+    index = (header['flags'] & COMPRESSION_MASK) >> COMPRESSION_SHIFT
+    if index >= len(COMPRESSIONS):
+        raise ValueError(f"Unknown payload compression {index}")
+    return COMPRESSIONS[index]
+
+def parse_header(raw_data):
+    """
+    Parse the header at the start of raw_data. Returns a dict with the payload
+    "length", "flags", original "name", "shard" ({"id", "index", "count"} or
+    None) and the header "size", or None when raw_data is too short to hold
+    the whole header.
+    """
+    if len(raw_data) < 4:
+        return None
+    length = struct.unpack('>I', raw_data[:4])[0]
+    if not length & EXTENDED_HEADER_BIT:
+        return {'length': length, 'flags': 0, 'name': None, 'shard': None, 'size': 4}
+
+    if len(raw_data) < 6:
+        return None
+    version, flags = struct.unpack('>BB', raw_data[4:6])
+    if version != HEADER_VERSION:
+        raise ValueError(f"Unsupported image header version {version}")
+
+    size = 6
+    name = None
+    if flags & FLAG_NAME:
+        if len(raw_data) < size + 2:
+            return None
+        name_length = struct.unpack('>H', raw_data[size:size + 2])[0]
+        size += 2
+        if len(raw_data) < size + name_length:
+            return None
+        name = bytes(raw_data[size:size + name_length]).decode('utf-8', 'replace')
+        size += name_length
+
+    shard = None
+    if flags & FLAG_SHARD:
+        if len(raw_data) < size + 24:
+            return None
+        set_id, index, count = struct.unpack('>16sII', raw_data[size:size + 24])
+        shard = {'id': set_id.hex(), 'index': index, 'count': count}
+        size += 24
+
+    return {'length': length & ~EXTENDED_HEADER_BIT, 'flags': flags, 'name': name, 'shard': shard, 'size': size}
+
+def payload_to_pixels(payload, header=None):
+    """
+    Pack a payload into an RGB pixel buffer using the same layout as ascii_to_rgb:
+    the header (by default the 4-byte big-endian length), the payload, then zero
+    padding up to a square-ish width x height image.
+    Returns (width, height, pixel_buffer)
+    """
+    if header is None:
+        header = pack_header(len(payload))
+    total_values = len(header) + len(payload)
+    width, height = image_dimensions(total_values)
+
+    # bytearray() zero-fills, so the padding comes for free
+    pixel_buffer = bytearray(width * height * 3)
+    view = memoryview(pixel_buffer)
+    view[:len(header)] = header
+    view[len(header):total_values] = payload
+
+    return width, height, pixel_buffer
+
+def file_to_pixels(filepath, name=None):
+    """
+    Bytes codec: read a file of any type straight into the channels of a pixel
+    buffer, without decoding or copying it. Returns (width, height,
+    pixel_buffer, header, payload_view), where payload_view is a memoryview of
+    the file's bytes inside pixel_buffer.
+    """
+    original_length = os.path.getsize(filepath)
+    header = pack_header(original_length, FLAG_RAW, name)
+    total_values = len(header) + original_length
+    width, height = image_dimensions(total_values)
+
+    pixel_buffer = bytearray(width * height * 3)
+    view = memoryview(pixel_buffer)
+    view[:len(header)] = header
+    payload_view = view[len(header):total_values]
+    with open(filepath, 'rb') as f:
+        if f.readinto(payload_view) != original_length:
+            raise ValueError(f"{filepath} changed while it was being read")
+
+    return width, height, pixel_buffer, header, payload_view
+
+def png_profile(profile=None):
+    """Settings of a named PNG profile (DEFAULT_PNG_PROFILE when None)"""
+    name = profile or DEFAULT_PNG_PROFILE
+    if name not in PNG_PROFILES:
+        raise ValueError(f"Unknown PNG profile '{name}', expected one of {', '.join(PNG_PROFILES)}")
+    return PNG_PROFILES[name]
+
+def profile_variant(profile=None):
+    """Image store variant for a profile; the default profile keeps the plain payload hash"""
+    name = profile or DEFAULT_PNG_PROFILE
+    return '' if name == 'default' else f'png:{name}'
+
+def image_variant(profile=None, codec='text', compression=None, name=None):
+    """
+    Image store variant for everything besides the payload that changes the PNG:
+    the profile, the compressor and, for the bytes codec, the stored file name
+    (always last, so the variant stays unambiguous).
+    """
+    from compression import compression_name
+
+    variant = profile_variant(profile)
+    compression = compression_name(compression)
+    if compression != 'none':
+        variant += f'|{compression}'
+    if codec == 'bytes':
+        variant += f'|bytes|{name or ""}'
+    return variant
+
+def save_png(width, height, pixel_buffer, image_name, profile=None):
+    """image_name is a path or a binary file object, e.g. a BytesIO to keep the PNG in memory"""
+    settings = png_profile(profile)
+
+    if settings['filter'] == 'none':
+        from png_stream import write_png_rows
+
+        view = memoryview(pixel_buffer)
+        chunks = (view[i:i + WRITE_CHUNK_SIZE] for i in range(0, len(view), WRITE_CHUNK_SIZE))
+        if hasattr(image_name, 'write'):
+            write_png_rows(image_name, width, height, chunks, settings['compress_level'], settings['strategy'])
+        else:
+            with open(image_name, 'wb') as out:
+                write_png_rows(out, width, height, chunks, settings['compress_level'], settings['strategy'])
+    else:
+        img = Image.frombuffer('RGB', (width, height), pixel_buffer, 'raw', 'RGB', 0, 1)
+        options = {'optimize': settings['optimize']}
+        # Passing Pillow's default values explicitly is not the same as leaving them out: its PNG
+        # default strategy is not zlib.Z_DEFAULT_STRATEGY
+        if settings['compress_level'] is not None:
+            options['compress_level'] = settings['compress_level']
+        if settings['strategy'] is not None:
+            options['compress_type'] = settings['strategy']
+        img.save(image_name, 'PNG', **options)
+
+    return image_name
+
+def payload_to_png(payload, image_name, profile=None, header=None):
+    width, height, pixel_buffer = payload_to_pixels(payload, header)
+    print(f"Creating image with dimensions {width}x{height} (total pixels: {width*height})")
+
+    return save_png(width, height, pixel_buffer, image_name, profile)
+
 def de_png_to_rgb(image_path, output_file):
     try:
         # Open the image and get raw pixel data
@@ -88,52 +318,664 @@ def de_png_to_rgb(image_path, output_file):
         # Create empty file if decryption fails
         open(output_file, 'w').close()
 
+def scratch_dir(workspace, name):
+    """
+    Directory `name` inside the request's workspace, so concurrent requests never
+    share a path. Without a workspace it is the relative directory of that name.
+    """
+    if workspace is not None:
+        return workspace.makedirs(name)
+    os.makedirs(name, exist_ok=True)
+    return name
+
+def next_image_name(directory='enimg'):
+    i = 1
+    img_name = os.path.join(directory, f"Demo{i}.png")
+
+    while os.path.exists(img_name):  # Check if file exists
+        i += 1
+        img_name = os.path.join(directory, f"Demo{i}.png")
+
+    return img_name
+
+def split_pixels(raw_data):
+    """
+    Parse the header at the start of a raw RGB buffer and return
+    (header, payload), where header is the dict from parse_header() and the
+    payload has been decompressed if the header says it was compressed. A
+    shard's payload is returned as stored: the set is decompressed as a whole.
+    """
+    header = parse_header(raw_data)
+    if header is None:
+        raise ValueError("Image too small to hold a header")
+    print(f"Original data length: {header['length']}")
+
+    from compression import decompress
+
+    start = header['size']
+    payload = bytes(memoryview(raw_data)[start:start + header['length']])
+    if header['shard']:
+        return header, payload
+    return header, decompress(payload, header_compression(header))
+
+def pixels_to_payload(raw_data):
+    """
+    Read the length header from a raw RGB buffer and return the payload slice,
+    like de_png_to_rgb does before writing it out line by line.
+    """
+    return split_pixels(raw_data)[1]
+
+def png_to_data(image_source):
+    """
+    image_source is a path or a binary file-like object holding the PNG.
+    Returns (header, payload).
+    """
+    with Image.open(image_source) as image:
+        width, height = image.size
+        raw_data = image.tobytes()
+
+    print(f"Decrypting image with dimensions {width}x{height}, data length: {len(raw_data)}")
+    return split_pixels(raw_data)
+
+def png_to_payload(image_source):
+    """image_source is a path or a binary file-like object holding the PNG"""
+    return png_to_data(image_source)[1]
+
+def decode_payload(header, payload):
+    """
+    Original file contents for a decoded payload: the exact bytes for the bytes
+    codec, the UTF-8 encoded text for the text codec.
+    """
+    from file_operations import payload_to_text
+
+    if header['flags'] & FLAG_RAW:
+        return payload
+    return payload_to_text(payload).encode('utf-8')
+
+def read_image(image_source):
+    """
+    (header, payload) of an encrypted PNG, like png_to_data(). An unreadable
+    image gives an empty text payload, the same outcome as the file-based
+    chain, which ends up with an empty file.
+    """
+    try:
+        return png_to_data(image_source)
+    except Exception as e:
+        print(f"Error in read_image: {str(e)}")
+        return parse_header(struct.pack('>I', 0)), b''
+
+def read_pixels(raw_data):
+    """read_image() for raw RGB pixels that are already decoded, e.g. a PDF image's samples"""
+    try:
+        return split_pixels(raw_data)
+    except Exception as e:
+        print(f"Error in read_pixels: {str(e)}")
+        return parse_header(struct.pack('>I', 0)), b''
+
+def decrypt_image_bytes(image_source):
+    """
+    Decode an encrypted PNG of either codec without temp files.
+    Returns (data, name): the original file's bytes and, for images written by
+    the bytes codec, its original file name (None otherwise).
+    """
+    header, payload = read_image(image_source)
+    if header['shard']:
+        raise ValueError(f"Image is shard {header['shard']['index'] + 1} of {header['shard']['count']}, "
+                         "decrypt it together with its set")
+
+    return decode_payload(header, payload), header['name']
+
+def decrypt_image(image_source):
+    """Decode an encrypted PNG straight to its original text without temp files"""
+    data, _ = decrypt_image_bytes(image_source)
+    return data.decode('utf-8', 'replace')
+
 # Encryption process
-def encrypt_file(filepath):
+def encrypt_file(filepath, image_name=None, profile=None, codec='text', name=None, compression=None):
+    """
+    Encrypt a file into a PNG saved with the named PNG profile. The "text"
+    codec reproduces the original character pipeline for text files; the
+    "bytes" codec stores the file's exact bytes, so it works for any file type
+    and records `name` as the original file name. `compression` names a
+    compressor from compression.COMPRESSIONS applied to the payload before it
+    is packed into pixels. By default the image goes into the
+    content-addressed image store, so encrypting identical content again
+    reuses the stored PNG instead of encoding (or compressing) it. Pass
+    image_name to write the image to that exact path instead.
+    """
+    from compression import compression_name
+    import image_store
+
+    compression = compression_name(compression)
+    flags = compression_flags(compression)
+    pixel_buffer = None
+    if codec == 'bytes':
+        flags |= FLAG_RAW
+        if compression == 'none':
+            # Nothing to transform, so the file is read straight into the pixel channels
+            print(f"Reading file into pixels: {filepath}")
+            width, height, pixel_buffer, _, payload = file_to_pixels(filepath, name)
+        else:
+            print(f"Reading file: {filepath}")
+            with open(filepath, 'rb') as f:
+                payload = f.read()
+    elif codec == 'text':
+        from file_operations import text_to_payload
+
+        print(f"Converting text file to payload: {filepath}")
+        name = None  # Only the bytes codec records the file name
+        payload = text_to_payload(filepath)
+    else:
+        raise ValueError(f"Unknown codec '{codec}', expected one of {', '.join(CODECS)}")
+
+    def write_image(path):
+        if pixel_buffer is not None:
+            print(f"Creating image with dimensions {width}x{height} (total pixels: {width*height})")
+            return save_png(width, height, pixel_buffer, path, profile)
+        return compressed_payload_to_png(payload, path, profile, compression, flags, name)
+
+    if image_name:
+        print(f"Converting payload to image: {image_name}")
+        return write_image(image_name)
+
+    key = image_store.image_key(payload, image_variant(profile, codec, compression, name))
+    return image_store.store(key, write_image, payload_bytes=len(payload))
+
+def compressed_payload_to_png(payload, image_name, profile, compression, flags, name=None):
+    """Compress a payload, then write it behind a header recording the compressor, flags and name"""
+    from compression import compress
+
+    stored = compress(payload, compression)
+    if compression != 'none':
+        print(f"Compressed payload with {compression}: {len(payload)} -> {len(stored)} bytes")
+    return payload_to_png(stored, image_name, profile, pack_header(len(stored), flags, name))
+
+def iter_source_chunks(source, chunk_size=1 << 20):
+    """Byte chunks of bytes, a binary file object or an iterable of byte chunks"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield source
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from source
+
+def encrypt_stream(source, image_name=None, profile=None, codec='bytes', name=None, compression=None):
+    """
+    encrypt_file() for data that is not in a file: source is bytes, a binary
+    file object such as an upload stream, or an iterable of byte chunks. It is
+    consumed once and not written to disk here. With the bytes codec and no
+    compression the data is read behind room for the header (straight into a
+    full-size pixel buffer when the stream is seekable), so it is already laid
+    out as pixels and is not copied again.
+    """
+    from compression import compression_name
+    import image_store
+
+    compression = compression_name(compression)
+    flags = compression_flags(compression)
+    if codec == 'bytes':
+        flags |= FLAG_RAW
+    elif codec == 'text':
+        name = None  # Only the bytes codec records the file name
+    else:
+        raise ValueError(f"Unknown codec '{codec}', expected one of {', '.join(CODECS)}")
+    variant = image_variant(profile, codec, compression, name)
+
+    pixel_buffer = None
+    if codec == 'text':
+        from file_operations import text_to_payload
+
+        if not hasattr(source, 'read'):
+            source = io.BytesIO(b''.join(iter_source_chunks(source)))
+        print("Converting text stream to payload")
+        payload = text_to_payload(source)
+        key = image_store.image_key(payload, variant)
+        payload_length = len(payload)
+    else:
+        hasher = image_store.key_hasher(variant)
+        if compression == 'none':
+            header_size = len(pack_header(0, flags, name))  # The length field has a fixed width
+            if hasattr(source, 'readinto') and hasattr(source, 'seek'):
+                # The size is known, so the stream is read straight into a full-size pixel buffer
+                payload_length = source_size(source) - source.tell()
+                width, height = image_dimensions(header_size + payload_length)
+                pixel_buffer = bytearray(width * height * 3)
+                with memoryview(pixel_buffer) as view:
+                    payload_view = view[header_size:header_size + payload_length]
+                    if source.readinto(payload_view) != payload_length:
+                        raise ValueError("Stream ended before its reported size")
+                    hasher.update(payload_view)
+                    payload_view.release()
+            else:
+                pixel_buffer = bytearray(header_size)
+                for chunk in iter_source_chunks(source):
+                    hasher.update(chunk)
+                    pixel_buffer += chunk
+                payload_length = len(pixel_buffer) - header_size
+        else:
+            chunks = []
+            for chunk in iter_source_chunks(source):
+                hasher.update(chunk)
+                chunks.append(chunk)
+            payload = b''.join(chunks)
+            del chunks
+            payload_length = len(payload)
+        key = hasher.hexdigest()
+    print(f"Read {payload_length} bytes from stream")
+
+    def write_image(path):
+        if pixel_buffer is not None:
+            pixel_buffer[:header_size] = pack_header(payload_length, flags, name)
+            width, height = image_dimensions(header_size + payload_length)
+            pixel_buffer.extend(bytes(width * height * 3 - len(pixel_buffer)))  # Zero padding, unless preallocated
+            print(f"Creating image with dimensions {width}x{height} (total pixels: {width*height})")
+            return save_png(width, height, pixel_buffer, path, profile)
+        return compressed_payload_to_png(payload, path, profile, compression, flags, name)
+
+    if image_name:
+        print(f"Converting payload to image: {image_name}")
+        return write_image(image_name)
+    return image_store.store(key, write_image, payload_bytes=payload_length)
+
+# Original file-based encryption chain, kept for comparison and benchmarking
+def encrypt_file_legacy(filepath, workspace=None):
     # Ensure temp and enimg directories exist
-    os.makedirs('temp', exist_ok=True)
-    os.makedirs('enimg', exist_ok=True)
+    temp_dir = scratch_dir(workspace, 'temp')
+    image_dir = scratch_dir(workspace, 'enimg')
+    bin_file = os.path.join(temp_dir, 'bin_en.txt')
+    ascii_file = os.path.join(temp_dir, 'output_ascii_en.txt')
     
     from file_operations import text_to_binary, binary_to_ascii
     
     print(f"Converting text file to binary: {filepath}")
-    text_to_binary(filepath, 'temp/bin_en.txt')
-    print(f"Converting binary to ASCII: temp/bin_en.txt")
-    binary_to_ascii("temp/bin_en.txt", "temp/output_ascii_en.txt")
+    text_to_binary(filepath, bin_file)
+    print(f"Converting binary to ASCII: {bin_file}")
+    binary_to_ascii(bin_file, ascii_file)
     
     # Generate unique filename
-    i = 1
-    img_name = f"enimg/Demo{i}.png"
-
-    while os.path.exists(img_name):  # Check if file exists
-        i += 1
-        img_name = f"enimg/Demo{i}.png"
+    img_name = next_image_name(image_dir)
 
     # Convert ASCII to image
-    print(f"Converting ASCII to image: temp/output_ascii_en.txt -> {img_name}")
-    return ascii_to_rgb("temp/output_ascii_en.txt", img_name)
+    print(f"Converting ASCII to image: {ascii_file} -> {img_name}")
+    return ascii_to_rgb(ascii_file, img_name)
+
+def iter_file_chunks(filepath, chunk_size=1 << 20):
+    """Chunks of a file given as a path or a binary file object (read from its current position)"""
+    if hasattr(filepath, 'read'):
+        yield from iter_source_chunks(filepath, chunk_size)
+        return
+    with open(filepath, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+def source_size(source):
+    """Size in bytes of a path or a seekable binary file object, whose position is left unchanged"""
+    if hasattr(source, 'seek'):
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END)
+        source.seek(position)
+        return size
+    return os.path.getsize(source)
+
+# Streaming encryption: constant memory regardless of the input size
+def encrypt_file_streaming(filepath, image_name=None, chunk_size=1 << 20, profile=None, codec='text', name=None,
+                           compression=None):
+    """
+    Encode a file into a PNG readable by decrypt_file while holding only about
+    chunk_size bytes of the input in memory. The file is read twice: once to
+    learn the stored (compressed) length for the header and the dimensions, and
+    the image store key, and once to write the pixel rows; compression runs in
+    both passes. Without image_name the image goes into the image store. Rows
+    are always written unfiltered; the profile supplies the zlib settings.
+    """
+    from png_stream import write_png_rows
+    from file_operations import iter_text_payload
+    from compression import compression_name, iter_compress
+    import image_store
+
+    settings = png_profile(profile)
+    compression = compression_name(compression)
+    flags = compression_flags(compression)
+    if codec == 'bytes':
+        flags |= FLAG_RAW
+        iter_payload = iter_file_chunks
+    elif codec == 'text':
+        name = None  # Only the bytes codec records the file name
+        iter_payload = iter_text_payload
+    else:
+        raise ValueError(f"Unknown codec '{codec}', expected one of {', '.join(CODECS)}")
+    hasher = image_store.key_hasher(image_variant(profile, codec, compression, name))
+
+    payload_length = 0
+
+    def hashed(chunks):
+        nonlocal payload_length
+        for chunk in chunks:
+            hasher.update(chunk)
+            payload_length += len(chunk)
+            yield chunk
+
+    if codec == 'bytes' and compression == 'none':
+        # The length is known up front, so the first pass only feeds the store key
+        stored_length = os.path.getsize(filepath)
+        if not image_name:
+            for _ in hashed(iter_payload(filepath, chunk_size)):
+                pass
+    else:
+        stored_length = 0
+        for chunk in iter_compress(hashed(iter_payload(filepath, chunk_size)), compression):
+            stored_length += len(chunk)
+    header = pack_header(stored_length, flags, name)
+    width, height = image_dimensions(len(header) + stored_length)
+
+    def pixel_chunks():
+        yield header
+        yield from iter_compress(iter_payload(filepath, chunk_size), compression)
+
+    def write_image(path):
+        print(f"Streaming {stored_length} values into {path} ({width}x{height})")
+        with open(path, 'wb') as out:
+            write_png_rows(out, width, height, pixel_chunks(), settings['compress_level'], settings['strategy'])
+        return path
+
+    if image_name:
+        return write_image(image_name)
+    return image_store.store(hasher.hexdigest(), write_image, payload_bytes=payload_length)
+
+def _iter_image_data(image_path):
+    """Yield the parsed header of an encrypted PNG, then its payload chunk by chunk"""
+    from png_stream import iter_png_pixels
+
+    with open(image_path, 'rb') as f:
+        header = None
+        remaining = None
+        start = b''
+        for pixels in iter_png_pixels(f):
+            if header is None:
+                start += pixels
+                header = parse_header(start)
+                if header is None:
+                    continue
+                yield header
+                remaining = header['length']
+                pixels = start[header['size']:]
+
+            if len(pixels) >= remaining:
+                if remaining:
+                    yield pixels[:remaining]
+                return
+            remaining -= len(pixels)
+            yield pixels
+
+        if header is None:
+            raise ValueError("Image too small to hold a header")
+
+def decrypt_stream(image_path):
+    """
+    Start decoding an encrypted PNG row batch by row batch. Returns (header,
+    payload_chunks); the chunks stop as soon as the length from the header has
+    been produced, without inflating the padding.
+    """
+    from compression import iter_decompress
+
+    chunks = _iter_image_data(image_path)
+    header = next(chunks)
+    if header['shard']:
+        return header, chunks  # Shards are decompressed as a set, see write_shard_set()
+    return header, iter_decompress(chunks, header_compression(header))
+
+def iter_decrypt_payload(image_path):
+    """Yield the payload bytes of an encrypted PNG chunk by chunk"""
+    return decrypt_stream(image_path)[1]
+
+def iter_decrypt_text(image_path):
+    """Yield the decrypted text of an encrypted PNG chunk by chunk"""
+    from file_operations import iter_payload_text
+
+    return iter_payload_text(iter_decrypt_payload(image_path))
+
+def decrypt_file_streaming(filepath, output_txt_file=None, workspace=None):
+    if output_txt_file is None:
+        output_txt_file = os.path.join(scratch_dir(workspace, 'temp'), 'output.txt')
+    output_dir = os.path.dirname(output_txt_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    header, chunks = decrypt_stream(filepath)
+    if header['shard']:
+        raise ValueError("Sharded images must be decrypted together with their set")
+    return write_decoded(header, chunks, output_txt_file)
+
+def write_decoded(header, payload_chunks, output_path):
+    """Write a (decompressed) payload to output_path the way its codec requires"""
+    from file_operations import iter_payload_text
+
+    if header['flags'] & FLAG_RAW:
+        with open(output_path, 'wb') as file:
+            for chunk in payload_chunks:
+                file.write(chunk)
+    else:
+        with open(output_path, 'w', encoding="utf-8") as file:
+            for text in iter_payload_text(payload_chunks):
+                file.write(text)
+
+    return output_path
+
+# Sharded mode: a payload split across several images of bounded size
+def shard_dimensions(total_values, max_dimension=None):
+    """image_dimensions(), but never wider or taller than max_dimension"""
+    max_dimension = max_dimension or SHARD_MAX_DIMENSION
+    width, height = image_dimensions(total_values)
+    if height > max_dimension:
+        total_pixels = (total_values + (-total_values % 3)) // 3
+        width = max_dimension
+        height = (total_pixels + width - 1) // width
+    if width > max_dimension or height > max_dimension:
+        raise ValueError(f"{total_values} values do not fit in a {max_dimension}x{max_dimension} image")
+    return width, height
+
+def shard_capacity(header_size, max_dimension=None):
+    """Payload bytes that fit in one image of at most max_dimension per side"""
+    max_dimension = max_dimension or SHARD_MAX_DIMENSION
+    return max_dimension * max_dimension * 3 - header_size
+
+def needs_sharding(filepath, name=None, max_dimension=None):
+    """Whether a file (a path or a seekable file object) is too large for one image of at most max_dimension per side"""
+    size = source_size(filepath)
+    return size > shard_capacity(len(pack_header(size, FLAG_RAW, name)), max_dimension)
+
+def encode_shard(source, offset, length, header, key, profile=None, max_dimension=None):
+    """
+    Store one shard image: `length` bytes of the file `source` from `offset`,
+    behind `header`. The bytes are read straight into the shard's pixel
+    buffer, so only one shard is in memory. Runs in a worker process.
+    """
+    import image_store
+
+    width, height = shard_dimensions(len(header) + length, max_dimension)
+
+    def write_image(path):
+        pixel_buffer = bytearray(width * height * 3)
+        view = memoryview(pixel_buffer)
+        view[:len(header)] = header
+        with open(source, 'rb') as f:
+            f.seek(offset)
+            if f.readinto(view[len(header):len(header) + length]) != length:
+                raise ValueError(f"{source} changed while it was being read")
+        print(f"Creating shard image with dimensions {width}x{height} (total pixels: {width*height})")
+        return save_png(width, height, pixel_buffer, path, profile)
+
+    return image_store.store(key, write_image, payload_bytes=length)
+
+def encrypt_file_sharded(filepath, profile=None, codec='bytes', name=None, compression=None,
+                         max_dimension=None, spool_dir=None):
+    """
+    Encrypt a file into as many images as needed so that none is wider or
+    taller than max_dimension. The payload is compressed as a whole, then cut
+    into shards that are encoded in parallel across the worker pool; every
+    shard's header records the set id, its index and the shard count. A
+    payload that fits in one image is written as a regular image.
+    filepath is a path or a seekable binary file object such as an upload
+    stream. Compressed or text payloads, and file objects, are staged in a
+    temporary file in spool_dir so the workers can read their byte ranges.
+    Returns the set's manifest, which is also saved in the image store and
+    reused when the same content is sharded again; shard_images() lists its
+    images in order. Call it from the parent process, not from a worker.
+    """
+    from file_operations import iter_text_payload
+    from compression import compression_name, iter_compress
+    import image_store
+    import worker_pool
+
+    max_dimension = max_dimension or SHARD_MAX_DIMENSION
+    compression = compression_name(compression)
+    flags = compression_flags(compression)
+    if codec == 'bytes':
+        flags |= FLAG_RAW
+        iter_payload = iter_file_chunks
+    elif codec == 'text':
+        name = None  # Only the bytes codec records the file name
+        iter_payload = iter_text_payload
+    else:
+        raise ValueError(f"Unknown codec '{codec}', expected one of {', '.join(CODECS)}")
+
+    def payload_chunks():
+        if hasattr(filepath, 'seek'):
+            filepath.seek(0)  # The source is read twice: to key the set, then to cut it
+        return iter_payload(filepath)
+
+    hasher = image_store.key_hasher(image_variant(profile, codec, compression, name) + f'|shards:{max_dimension}')
+    payload_length = 0
+    for chunk in payload_chunks():
+        hasher.update(chunk)
+        payload_length += len(chunk)
+    key = hasher.hexdigest()
+
+    manifest = image_store.load_manifest(key)
+    if manifest and all(image_store.lookup(shard_key) for shard_key in manifest['shards']):
+        print(f"Reusing stored shard set {key}")
+        return manifest
+
+    spool = None
+    try:
+        if codec == 'bytes' and compression == 'none' and not hasattr(filepath, 'read'):
+            source = filepath  # Shards read their byte ranges straight from the file
+        else:
+            fd, spool = tempfile.mkstemp(prefix='shards_', suffix='.bin', dir=spool_dir)
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter_compress(payload_chunks(), compression):
+                    f.write(chunk)
+            source = spool
+        stored_length = os.path.getsize(source)
+
+        single_header = pack_header(stored_length, flags, name)
+        if stored_length <= shard_capacity(len(single_header), max_dimension):
+            pieces = [(0, stored_length, single_header)]
+        else:
+            set_id = bytes.fromhex(key[:32])
+            capacity = shard_capacity(len(pack_header(0, flags, name, (set_id, 0, 0))), max_dimension)
+            count = -(-stored_length // capacity)  # Ceiling division
+            pieces = []
+            for index in range(count):
+                offset = index * capacity
+                length = min(capacity, stored_length - offset)
+                pieces.append((offset, length, pack_header(length, flags, name, (set_id, index, count))))
+
+        shard_keys = [image_store.image_key(f'{key}/{index}'.encode('utf-8')) for index in range(len(pieces))]
+        tasks = [(source, offset, length, header, shard_key, profile, max_dimension)
+                 for (offset, length, header), shard_key in zip(pieces, shard_keys)]
+        print(f"Encoding {len(tasks)} shard(s) of at most {max_dimension}x{max_dimension}")
+        for index, (success, result) in enumerate(worker_pool.run_tasks(encode_shard, tasks)):
+            if not success:
+                raise RuntimeError(f"Shard {index + 1} of {len(tasks)}: {result}")
+    finally:
+        if spool:
+            os.remove(spool)
+
+    manifest = {
+        "key": key,
+        "name": name,
+        "codec": codec,
+        "compression": compression,
+        "max_dimension": max_dimension,
+        "payload_bytes": payload_length,
+        "stored_bytes": stored_length,
+        "shards": shard_keys,
+    }
+    image_store.save_manifest(manifest)
+    return manifest
+
+def shard_images(manifest):
+    """Image paths of a shard set, in order"""
+    import image_store
+
+    return [image_store.image_path(shard_key) for shard_key in manifest['shards']]
+
+def write_shard_set(shards, output_path):
+    """
+    Reassemble a shard set from (header, piece_path) pairs in any order, where
+    each piece file holds the stored bytes of one shard, and write the decoded
+    file to output_path. Raises ValueError if shards are missing.
+    """
+    from compression import iter_decompress
+
+    shards = sorted(shards, key=lambda shard: shard[0]['shard']['index'])
+    header = shards[0][0]
+    count = header['shard']['count']
+    if [shard_header['shard']['index'] for shard_header, _ in shards] != list(range(count)):
+        raise ValueError(f"Incomplete shard set {header['shard']['id']}: {len(shards)} of {count} shards")
+
+    chunks = (chunk for _, piece_path in shards for chunk in iter_file_chunks(piece_path))
+    return write_decoded(header, iter_decompress(chunks, header_compression(header)), output_path)
 
 # Decryption process
-def decrypt_file(filepath):
+def decrypt_file(filepath, output_txt_file=None, workspace=None):
+    if output_txt_file is None:
+        output_txt_file = os.path.join(scratch_dir(workspace, 'temp'), 'output.txt')
+    output_dir = os.path.dirname(output_txt_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    print(f"Decrypting image: {filepath}")
+    data, _ = decrypt_image_bytes(filepath)
+
+    with open(output_txt_file, 'wb') as file:
+        file.write(data)
+
+    return output_txt_file
+
+# Original five-stage file-based decryption chain, kept for comparison and benchmarking
+def decrypt_file_legacy(filepath, workspace=None):
     # Ensure temp directory exists
-    os.makedirs('temp', exist_ok=True)
+    temp_dir = scratch_dir(workspace, 'temp')
+    ascii_file = os.path.join(temp_dir, 'output_acsii_de.txt')
+    bin_file = os.path.join(temp_dir, 'bin_de.txt')
+    spaced_file = os.path.join(temp_dir, 'sbin_de.txt')
+    text_file = os.path.join(temp_dir, 'lbin_de.txt')
     
     from file_operations import rgb_binary_de, join_lines_with_space, de_bin_to_text, remove_last_letter
     
     print(f"Converting image to RGB values: {filepath}")
-    de_png_to_rgb(filepath, "temp/output_acsii_de.txt")
+    de_png_to_rgb(filepath, ascii_file)
     
     print("Converting RGB values to binary")
-    rgb_binary_de("temp/output_acsii_de.txt", "temp/bin_de.txt")
+    rgb_binary_de(ascii_file, bin_file)
     
     print("Joining binary values with spaces")
-    join_lines_with_space('temp/bin_de.txt', 'temp/sbin_de.txt')
+    join_lines_with_space(bin_file, spaced_file)
     
     print("Converting binary to text")
-    de_bin_to_text('temp/sbin_de.txt', 'temp/lbin_de.txt')
+    de_bin_to_text(spaced_file, text_file)
     
-    output_txt_file = 'temp/output.txt'
+    output_txt_file = os.path.join(temp_dir, 'output.txt')
     print(f"Removing last letter and saving to {output_txt_file}")
-    remove_last_letter('temp/lbin_de.txt', output_txt_file)
+    remove_last_letter(text_file, output_txt_file)
     
     return output_txt_file
\ No newline at end of file
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+# Get the project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Encrypted images are stored as <root>/<first 2 hex chars>/<sha256>.png
+STORE_ROOT = os.environ.get('IMAGE_STORE_DIR', os.path.join(PROJECT_ROOT, 'enimg'))
+INDEX_FILE = 'index.jsonl'
+
+
+def key_hasher(variant=''):
+    """Incremental form of image_key: feed the payload with update(), then call hexdigest()"""
+    return hashlib.sha256(variant.encode('utf-8'))
+
+
+def image_key(payload, variant=''):
+    """
+    Content address of an encrypted image: the SHA-256 of its payload, plus a
+    variant string for anything else that changes the PNG's bytes.
+    """
+    digest = key_hasher(variant)
+    digest.update(payload)
+    return digest.hexdigest()
+
+
+def image_path(key):
+    return os.path.join(STORE_ROOT, key[:2], f'{key}.png')
+
+
+def lookup(key):
+    """Path of the stored image for this key, or None. A single stat, whatever the store size."""
+    path = image_path(key)
+    return path if os.path.exists(path) else None
+
+
+def store(key, write_image, **metadata):
+    """
+    Return the stored image for key, creating it with write_image(path) if it
+    is missing. The image is written to a temporary name and renamed into
+    place, so concurrent writers of the same content never expose a partial file.
+    """
+    path = lookup(key)
+    if path:
+        print(f"Reusing stored image {path}")
+        return path
+
+    path = image_path(key)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{key}.', suffix='.png', dir=directory)
+    os.close(fd)
+    try:
+        write_image(temp_path)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    record = {"key": key, "bytes": os.path.getsize(path), "created": time.time()}
+    record.update(metadata)
+    append_index(record)
+    return path
+
+
+def manifest_path(key):
+    return os.path.join(STORE_ROOT, key[:2], f'{key}.json')
+
+
+def save_manifest(manifest):
+    """Save a shard set's manifest next to its images, keyed by manifest["key"]"""
+    path = manifest_path(manifest['key'])
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(prefix=f".{manifest['key']}.", suffix='.json', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path
+
+
+def load_manifest(key):
+    """The saved manifest for key, or None"""
+    try:
+        with open(manifest_path(key), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def append_index(record):
+    # One short line per write with O_APPEND, so concurrent workers don't interleave entries
+    os.makedirs(STORE_ROOT, exist_ok=True)
+    line = (json.dumps(record) + '\n').encode('utf-8')
+    fd = os.open(os.path.join(STORE_ROOT, INDEX_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
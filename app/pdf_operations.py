@@ -1,8 +1,238 @@
+import os
 from fpdf import FPDF
 
+# Images per worker decoded from the PDF before they are handed to the pool
+DECRYPT_WINDOW_PER_WORKER = 2
+
 def create_pdf_from_images(image_paths, output_path):
     pdf = FPDF()
     for image_path in image_paths:
         pdf.add_page()
         pdf.image(image_path, x=10, y=10, w=180)
-    pdf.output(output_path)
\ No newline at end of file
+    pdf.output(output_path)
+
+def build_pdf(images, output):
+    """
+    Build the same one-image-per-page PDF as create_pdf_from_images without
+    FPDF re-reading images from disk. Each item of images is a PNG as bytes,
+    a binary file object, a file path, or a (width, height, pixel_buffer)
+    tuple of raw RGB pixels. PNG data is embedded losslessly as is; raw pixels
+    are zlib-compressed. output is a path or a binary file object (e.g. a
+    BytesIO or a response stream); the PDF is written to it page by page.
+    """
+    from pdf_stream import PdfWriter
+
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'wb') as out:
+            return build_pdf(images, out)
+
+    writer = PdfWriter(output)
+    for image in images:
+        if isinstance(image, tuple):
+            writer.add_pixels(*image)
+        elif isinstance(image, (str, os.PathLike)):
+            with open(image, 'rb') as f:
+                writer.add_png(f.read())
+        elif hasattr(image, 'read'):
+            writer.add_png(image.read())
+        else:
+            writer.add_png(image)
+    writer.close()
+    return output
+
+def open_pdf(pdf_source):
+    """Open a PDF given as a path, bytes or a binary file object, without writing it to disk"""
+    import fitz
+
+    if isinstance(pdf_source, (str, os.PathLike)):
+        return fitz.open(pdf_source)
+    if hasattr(pdf_source, 'read'):
+        pdf_source = pdf_source.read()
+    return fitz.open(stream=pdf_source, filetype='pdf')
+
+
+def iter_pdf_xrefs(pdf_document):
+    """Yield (page_number, image_index, xref) in page order, each image (xref) once"""
+    processed_images = set()  # Track processed images to avoid duplicates
+    for page_number in range(len(pdf_document)):
+        page = pdf_document.load_page(page_number)
+        for image_index, img in enumerate(page.get_images(full=True)):
+            xref = img[0]
+            if xref in processed_images:
+                continue  # Skip already processed images
+            processed_images.add(xref)
+            yield page_number, image_index, xref
+
+
+def extract_pdf_images(pdf_source):
+    """
+    Extract the images of a PDF as (page_number, image_index, image_bytes)
+    tuples in page order, skipping images (xrefs) that were already extracted
+    from an earlier page.
+    """
+    with open_pdf(pdf_source) as pdf_document:
+        return [(page_number, image_index, pdf_document.extract_image(xref)["image"])
+                for page_number, image_index, xref in iter_pdf_xrefs(pdf_document)]
+
+
+def iter_pdf_pixels(pdf_source):
+    """
+    Yield the images of a PDF as (page_number, image_index, pixels) tuples in
+    page order, where pixels are the raw RGB samples decoded by MuPDF, the same
+    bytes as Image.tobytes() on the extracted PNG. No PNG is encoded or
+    decoded on the way.
+    """
+    import fitz
+
+    with open_pdf(pdf_source) as pdf_document:
+        for page_number, image_index, xref in iter_pdf_xrefs(pdf_document):
+            pixmap = fitz.Pixmap(pdf_document, xref)
+            if pixmap.alpha:
+                pixmap = fitz.Pixmap(pixmap, 0)
+            if pixmap.n != 3:
+                pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+            yield page_number, image_index, pixmap.samples
+
+
+def decrypted_file_name(page_number, image_index, name=None):
+    """Output name of a decrypted image; images from the bytes codec keep their original file name"""
+    if name:
+        from werkzeug.utils import secure_filename
+
+        name = secure_filename(name)
+    if name:
+        return f'decrypted_{page_number}_{image_index}_{name}'
+    return f'decrypted_{page_number}_{image_index}.txt'
+
+
+def pack_result(name, data):
+    """Decrypt cache value: the original file name (empty for text images), a NUL, then the bytes"""
+    return (name or '').encode('utf-8') + b'\0' + data
+
+
+def unpack_result(value):
+    name, _, data = value.partition(b'\0')
+    return name.decode('utf-8') or None, data
+
+
+def decrypt_images(images, piece_dir, output_dir):
+    """
+    Decrypt a batch of images extracted from a PDF.
+    images is a list of (page_number, image_index, pixels) tuples. Returns
+    one (success, (path, original_name, header)_or_error) tuple per image, in
+    the same order. path is the decrypted file, except for shards of a sharded
+    file: their stored bytes are written to a piece file in piece_dir, path
+    points to it and header is the shard's header, for write_shard_set().
+    Runs in a worker process.
+    """
+    import image_operations
+
+    results = []
+    for page_number, image_index, pixels in images:
+        try:
+            header, payload = image_operations.read_pixels(pixels)
+            if header['shard']:
+                shard = header['shard']
+                os.makedirs(piece_dir, exist_ok=True)
+                # The same file uploaded twice has the same set id, so the piece is also named by its image
+                piece_path = os.path.join(piece_dir, f"shard_{shard['id']}_{shard['index']}_{page_number}_{image_index}.bin")
+                with open(piece_path, 'wb') as f:
+                    f.write(payload)
+                results.append((True, (piece_path, header['name'], header)))
+                continue
+
+            # Generate a unique name for the decrypted file
+            decrypted_file_path = os.path.join(output_dir, decrypted_file_name(page_number, image_index, header['name']))
+            with open(decrypted_file_path, 'wb') as f:
+                f.write(image_operations.decode_payload(header, payload))
+            results.append((True, (decrypted_file_path, header['name'], None)))
+        except Exception as e:
+            results.append((False, f"page {page_number + 1}, image {image_index + 1}: {type(e).__name__}: {e}"))
+    return results
+
+
+def decrypt_pdf(pdf_source, piece_dir, output_dir):
+    """
+    Decrypt every image in a PDF into output_dir, in page/image order.
+    pdf_source is a path, bytes or a binary file object such as the uploaded
+    file's stream; images are decoded from MuPDF's pixel samples, so no PDF or
+    image files are written. Only the stored bytes of shards go to piece_dir.
+    Results already in the decrypt cache are written straight out; the rest are
+    decrypted across the worker pool and then cached. The shards of a sharded
+    file are decoded in parallel like any image, then reassembled in order into
+    one file at the position of the set's first shard (shards are not cached).
+    Returns (decrypted_paths, errors).
+    """
+    import decrypt_cache
+    import image_operations
+    import worker_pool
+
+    decrypted_files = {}
+    errors = []
+    shard_sets = {}
+    counts = {"images": 0, "cached": 0}
+
+    def decrypt_misses(misses):
+        batches = worker_pool.split_batches(misses)
+        tasks = [([image for _, _, image in batch], piece_dir, output_dir) for batch in batches]
+        for batch, (success, batch_results) in zip(batches, worker_pool.run_tasks(decrypt_images, tasks)):
+            if not success:
+                errors.append(batch_results)
+                continue
+            for (position, key, (page_number, image_index, _)), (image_success, result) in zip(batch, batch_results):
+                if not image_success:
+                    errors.append(result)
+                    continue
+                decrypted_file_path, name, shard_header = result
+                if shard_header:
+                    # Set ids come from the content, so identical files share one: a shard joins the
+                    # first set of its id (in page order) that does not have its index yet
+                    shard_index = shard_header['shard']['index']
+                    id_sets = shard_sets.setdefault(shard_header['shard']['id'], [])
+                    shard_set = next((s for s in id_sets if shard_index not in s["indexes"]), None)
+                    if shard_set is None:
+                        shard_set = {"position": position, "page": page_number, "index": image_index, "name": name,
+                                     "shards": [], "indexes": set()}
+                        id_sets.append(shard_set)
+                    shard_set["indexes"].add(shard_index)
+                    shard_set["shards"].append((shard_header, decrypted_file_path))
+                    continue
+                decrypted_files[position] = decrypted_file_path
+                with open(decrypted_file_path, 'rb') as f:
+                    decrypt_cache.put(key, pack_result(name, f.read()))
+
+    # Images are decoded and sent to the pool a window at a time, so only a few
+    # images' raw pixels are held in memory whatever the size of the PDF
+    window = max(1, worker_pool.POOL_SIZE) * DECRYPT_WINDOW_PER_WORKER
+    misses = []
+    for position, (page_number, image_index, pixels) in enumerate(iter_pdf_pixels(pdf_source)):
+        counts["images"] += 1
+        key = decrypt_cache.cache_key(pixels)
+        cached = decrypt_cache.get(key)
+        if cached is None:
+            misses.append((position, key, (page_number, image_index, pixels)))
+            if len(misses) >= window:
+                decrypt_misses(misses)
+                misses = []
+            continue
+        counts["cached"] += 1
+        name, data = unpack_result(cached)
+        decrypted_file_path = os.path.join(output_dir, decrypted_file_name(page_number, image_index, name))
+        with open(decrypted_file_path, 'wb') as f:
+            f.write(data)
+        decrypted_files[position] = decrypted_file_path
+    if misses:
+        decrypt_misses(misses)
+
+    print(f"Decrypted {counts['images']} images ({counts['cached']} cached)")
+
+    for shard_set in (shard_set for id_sets in shard_sets.values() for shard_set in id_sets):
+        decrypted_file_path = os.path.join(output_dir, decrypted_file_name(shard_set["page"], shard_set["index"], shard_set["name"]))
+        try:
+            image_operations.write_shard_set(shard_set["shards"], decrypted_file_path)
+        except Exception as e:
+            errors.append(f"page {shard_set['page'] + 1}, image {shard_set['index'] + 1}: {type(e).__name__}: {e}")
+            continue
+        decrypted_files[shard_set["position"]] = decrypted_file_path
+
+    return [decrypted_files[position] for position in sorted(decrypted_files)], errors
@@ -0,0 +1,120 @@
+import struct
+import zlib
+
+from png_stream import PNG_SIGNATURE
+
+# Page geometry of create_pdf_from_images (FPDF defaults): A4 portrait, the image
+# 10 mm from the top-left corner and 180 mm wide. PDF units are points.
+MM = 72 / 25.4
+PAGE_WIDTH = 210 * MM
+PAGE_HEIGHT = 297 * MM
+IMAGE_X = 10 * MM
+IMAGE_Y = 10 * MM
+IMAGE_WIDTH = 180 * MM
+
+
+def png_image_data(png):
+    """
+    Return (width, height, idat) for an 8-bit, non-interlaced RGB PNG given as
+    bytes. The concatenated IDAT data is embedded in the PDF as is, with the
+    PNG predictor, so the image is neither decoded nor recompressed.
+    """
+    view = memoryview(png)
+    if bytes(view[:8]) != PNG_SIGNATURE:
+        raise ValueError("Not a PNG image")
+
+    width = height = None
+    idat = []
+    position = 8
+    while position + 8 <= len(view):
+        length, chunk_type = struct.unpack('>I4s', view[position:position + 8])
+        data = view[position + 8:position + 8 + length]
+        if chunk_type == b'IHDR':
+            width, height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', data)
+            if bit_depth != 8 or color_type != 2 or interlace:
+                raise ValueError("Only 8-bit non-interlaced RGB PNGs can be embedded")
+        elif chunk_type == b'IDAT':
+            idat.append(data)
+        elif chunk_type == b'IEND':
+            break
+        position += length + 12  # Length, type and CRC around the data
+
+    if width is None or not idat:
+        raise ValueError("Truncated PNG image")
+    return width, height, b''.join(idat)
+
+
+class PdfWriter:
+    """
+    Write a PDF with one image per page to the binary file object `out`. Pages
+    are written as soon as they are added, so only the current image is held
+    in memory, and `out` only needs write(): it can be a file, a BytesIO or a
+    response stream.
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.position = 0
+        self.offsets = {}
+        self.pages = []
+        self.next_id = 3  # 1 is the catalog, 2 the page tree
+        self.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def write(self, data):
+        self.out.write(data)
+        self.position += len(data)
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def write_object(self, object_id, body, stream=None):
+        self.offsets[object_id] = self.position
+        self.write(f'{object_id} 0 obj\n'.encode('ascii'))
+        self.write(body.encode('ascii'))
+        if stream is not None:
+            self.write(b'\nstream\n')
+            self.write(stream)
+            self.write(b'\nendstream')
+        self.write(b'\nendobj\n')
+
+    def add_png(self, png):
+        """Add a page showing a PNG given as bytes"""
+        width, height, idat = png_image_data(png)
+        self.add_image(width, height, idat,
+                       f'/DecodeParms << /Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns {width} >>')
+
+    def add_pixels(self, width, height, pixel_buffer, compress_level=6):
+        """Add a page showing raw RGB pixels, compressed losslessly with zlib"""
+        self.add_image(width, height, zlib.compress(pixel_buffer, compress_level))
+
+    def add_image(self, width, height, data, decode_parms=''):
+        image_id = self.new_id()
+        self.write_object(image_id, (
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceRGB '
+            f'/BitsPerComponent 8 /Filter /FlateDecode {decode_parms} /Length {len(data)} >>'), data)
+
+        # Same placement as FPDF's image(x=10, y=10, w=180): the height follows the aspect ratio
+        shown_height = IMAGE_WIDTH * height / width
+        content = (f'q {IMAGE_WIDTH:.2f} 0 0 {shown_height:.2f} {IMAGE_X:.2f} '
+                   f'{PAGE_HEIGHT - IMAGE_Y - shown_height:.2f} cm /I{image_id} Do Q').encode('ascii')
+        content_id = self.new_id()
+        self.write_object(content_id, f'<< /Length {len(content)} >>', content)
+
+        page_id = self.new_id()
+        self.write_object(page_id, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH:.2f} {PAGE_HEIGHT:.2f}] '
+            f'/Resources << /XObject << /I{image_id} {image_id} 0 R >> >> /Contents {content_id} 0 R >>'))
+        self.pages.append(page_id)
+
+    def close(self):
+        """Write the page tree, cross-reference table and trailer"""
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.pages)
+        self.write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>')
+        self.write_object(1, '<< /Type /Catalog /Pages 2 0 R >>')
+
+        xref_position = self.position
+        self.write(f'xref\n0 {self.next_id}\n0000000000 65535 f \n'.encode('ascii'))
+        for object_id in range(1, self.next_id):
+            self.write(f'{self.offsets[object_id]:010d} 00000 n \n'.encode('ascii'))
+        self.write(f'trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_position}\n%%EOF\n'.encode('ascii'))
@@ -0,0 +1,145 @@
+import io
+import struct
+import zlib
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+IDAT_SIZE = 65536  # Flush compressed data in IDAT chunks of about this size
+ROWS_PER_BATCH = 64
+
+def write_chunk(out, chunk_type, data):
+    out.write(struct.pack('>I', len(data)))
+    out.write(chunk_type)
+    out.write(data)
+    out.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+
+def write_png_rows(out, width, height, pixel_chunks, compress_level=6, strategy=zlib.Z_DEFAULT_STRATEGY):
+    """
+    Write an 8-bit RGB PNG to the binary file object `out` from an iterable of
+    raw pixel byte chunks of any size. Rows are compressed and written as soon
+    as they are complete, so memory use does not grow with the image size.
+    Missing trailing pixels are padded with zeros. A compress_level or
+    strategy of None means zlib's default.
+    """
+    row_size = width * 3
+    if compress_level is None:
+        compress_level = zlib.Z_DEFAULT_COMPRESSION
+    if strategy is None:
+        strategy = zlib.Z_DEFAULT_STRATEGY
+
+    out.write(PNG_SIGNATURE)
+    write_chunk(out, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    compressor = zlib.compressobj(compress_level, zlib.DEFLATED, zlib.MAX_WBITS, 9, strategy)
+    compressed = bytearray()
+    pending = bytearray()
+    rows_written = 0
+
+    def emit_rows(data, row_count):
+        nonlocal rows_written
+        # Every scanline is prefixed by filter type 0 (None)
+        filtered = bytearray()
+        for row in range(row_count):
+            filtered += b'\x00'
+            filtered += data[row * row_size:(row + 1) * row_size]
+        compressed.extend(compressor.compress(bytes(filtered)))
+        rows_written += row_count
+        while len(compressed) >= IDAT_SIZE:
+            write_chunk(out, b'IDAT', bytes(compressed[:IDAT_SIZE]))
+            del compressed[:IDAT_SIZE]
+
+    for chunk in pixel_chunks:
+        pending += chunk
+        row_count = min(len(pending) // row_size, height - rows_written)
+        if row_count:
+            emit_rows(pending, row_count)
+            del pending[:row_count * row_size]
+
+    # Pad the remaining rows with zeros, a batch at a time
+    while rows_written < height:
+        row_count = min(ROWS_PER_BATCH, height - rows_written)
+        pending += bytes(row_count * row_size - len(pending))
+        emit_rows(pending, row_count)
+        pending = bytearray()
+
+    compressed.extend(compressor.flush())
+    if compressed:
+        write_chunk(out, b'IDAT', bytes(compressed))
+    write_chunk(out, b'IEND', b'')
+
+def read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated PNG stream")
+    return data
+
+def unfilter_rows(data, row_count, prev, width):
+    """
+    Unfilter row_count scanlines of an 8-bit RGB image (each a filter type
+    byte, then width * 3 bytes) that follow the pixel row prev, and return
+    their pixels. Rows that all use filter 0 (None), as write_png_rows writes
+    them, are only copied. Other filters depend on the pixel to the left, so
+    they cannot be undone a row at a time in Python; Pillow's C decoder
+    unfilters them instead, from a PNG of prev (as a filter 0 row) followed by
+    these rows, stored with zlib level 0.
+    """
+    from PIL import Image
+
+    row_size = width * 3
+    stride = row_size + 1
+    if not any(data[row * stride] for row in range(row_count)):
+        return b''.join(data[row * stride + 1:(row + 1) * stride] for row in range(row_count))
+
+    png = io.BytesIO()
+    png.write(PNG_SIGNATURE)
+    write_chunk(png, b'IHDR', struct.pack('>IIBBBBB', width, row_count + 1, 8, 2, 0, 0, 0))
+    write_chunk(png, b'IDAT', zlib.compress(b'\x00' + bytes(prev) + bytes(data[:row_count * stride]), 0))
+    write_chunk(png, b'IEND', b'')
+    png.seek(0)
+    with Image.open(png) as image:
+        return image.tobytes()[row_size:]
+
+def iter_png_pixels(f, max_chunk=1 << 20):
+    """
+    Yield the raw RGB pixel bytes of an 8-bit, non-interlaced RGB PNG read from
+    the binary file object `f`, a batch of rows at a time, in the same order as
+    Image.tobytes(). Only one compressed chunk and a bounded amount of
+    decompressed data are held in memory at once.
+    """
+    if f.read(8) != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+
+    decompressor = zlib.decompressobj()
+    width = row_size = None
+    prev = None
+    pending = bytearray()
+
+    while True:
+        length, chunk_type = struct.unpack('>I4s', read_exact(f, 8))
+
+        if chunk_type == b'IHDR':
+            width, height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', read_exact(f, length))
+            if bit_depth != 8 or color_type != 2 or interlace:
+                raise ValueError("Only 8-bit non-interlaced RGB PNGs can be streamed")
+            row_size = width * 3
+            prev = bytearray(row_size)
+        elif chunk_type == b'IDAT':
+            remaining = length
+            while remaining:
+                data = read_exact(f, min(remaining, max_chunk))
+                remaining -= len(data)
+                while data:
+                    pending += decompressor.decompress(data, max_chunk)
+                    data = decompressor.unconsumed_tail
+
+                    row_count = len(pending) // (row_size + 1)
+                    if row_count:
+                        rows = unfilter_rows(pending, row_count, prev, width)
+                        prev = rows[-row_size:]
+                        del pending[:row_count * (row_size + 1)]
+                        yield rows
+        elif chunk_type == b'IEND':
+            return
+        else:
+            f.read(length)
+
+        f.read(4)  # CRC
@@ -0,0 +1,97 @@
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Number of worker processes for CPU-bound encode/decode work (1 runs everything inline)
+POOL_SIZE = int(os.environ.get('WORKER_POOL_SIZE', os.cpu_count() or 1))
+
+# "spawn" is safe to use from a threaded server; "fork" starts faster
+START_METHOD = os.environ.get('WORKER_POOL_START_METHOD', 'spawn')
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use (and again after a fork)"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            context = multiprocessing.get_context(START_METHOD)
+            _pool = ProcessPoolExecutor(max_workers=POOL_SIZE, mp_context=context)
+            _pool_pid = os.getpid()
+            print(f"\033[92m[INFO]\033[0m Started worker pool with {POOL_SIZE} processes ({START_METHOD})")
+        return _pool
+
+
+def reset_pool():
+    """Drop a broken pool so the next call starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def describe_error(error):
+    return f"{type(error).__name__}: {error}"
+
+
+def run_tasks(func, tasks):
+    """
+    Run func(*args) for every args tuple in tasks, across the worker pool.
+    Returns a list in the same order as tasks, where each entry is a
+    (success, result_or_error_message) tuple, so one failing task does not
+    affect the others.
+    """
+    # Inside a worker (e.g. a task that itself fans out) run inline rather than nesting pools
+    if POOL_SIZE <= 1 or len(tasks) <= 1 or multiprocessing.parent_process() is not None:
+        results = []
+        for args in tasks:
+            try:
+                results.append((True, func(*args)))
+            except Exception as e:
+                results.append((False, describe_error(e)))
+        return results
+
+    try:
+        futures = [get_pool().submit(func, *args) for args in tasks]
+    except BrokenProcessPool:
+        reset_pool()
+        futures = [get_pool().submit(func, *args) for args in tasks]
+
+    results = []
+    for future in futures:
+        try:
+            results.append((True, future.result()))
+        except BrokenProcessPool as e:
+            # A worker died (e.g. killed for memory); start over with a new pool next time
+            reset_pool()
+            results.append((False, describe_error(e)))
+        except Exception as e:
+            results.append((False, describe_error(e)))
+    return results
+
+
+def split_batches(items, batches_per_worker=4):
+    """
+    Split items into consecutive, order-preserving batches: enough to keep every
+    worker busy, but few enough that per-task setup is amortized.
+    """
+    if not items:
+        return []
+    count = min(len(items), POOL_SIZE * batches_per_worker)
+    size = -(-len(items) // count)  # Ceiling division
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _shutdown():
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(_shutdown)
@@ -0,0 +1,92 @@
+import os
+import re
+import shutil
+import tempfile
+import time
+
+# Get the project root directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Scratch space for a single request, removed when the request finishes
+WORKSPACE_ROOT = os.path.join(PROJECT_ROOT, 'temp', 'workspaces')
+
+# Results that must outlive the request (e.g. the PDF or ZIP offered for download)
+JOB_ROOT = os.path.join(PROJECT_ROOT, 'temp', 'jobs')
+
+# Jobs older than this are removed the next time a job is created
+JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 3600))
+
+JOB_ID_PATTERN = re.compile(r'^job_[A-Za-z0-9_]+$')
+
+
+class Workspace:
+    """
+    An isolated scratch directory. Everything a request or job writes goes
+    under its own directory, so concurrent requests never share a path.
+    Use it as a context manager to remove the directory afterwards.
+    """
+
+    def __init__(self, root=WORKSPACE_ROOT, prefix='ws_', directory=None):
+        if directory is None:
+            os.makedirs(root, exist_ok=True)
+            directory = tempfile.mkdtemp(prefix=prefix, dir=root)
+        self.directory = directory
+
+    @property
+    def id(self):
+        return os.path.basename(self.directory)
+
+    def path(self, *parts):
+        """Path of a file inside the workspace"""
+        return os.path.join(self.directory, *parts)
+
+    def makedirs(self, *parts):
+        """Create (if needed) and return a subdirectory of the workspace"""
+        directory = self.path(*parts)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+        return False
+
+
+def create_job():
+    """Create a workspace for results that are downloaded in a later request"""
+    cleanup_stale_jobs()
+    return Workspace(root=JOB_ROOT, prefix='job_')
+
+
+def open_job(job_id):
+    """Return the job workspace with this id, or None if it no longer exists"""
+    if not job_id or not JOB_ID_PATTERN.match(job_id):
+        return None
+    directory = os.path.join(JOB_ROOT, job_id)
+    if not os.path.isdir(directory):
+        return None
+    return Workspace(directory=directory)
+
+
+def discard_job(job_id):
+    job = open_job(job_id)
+    if job:
+        job.cleanup()
+
+
+def cleanup_stale_jobs(max_age=JOB_TTL_SECONDS):
+    if not os.path.isdir(JOB_ROOT):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(JOB_ROOT):
+        directory = os.path.join(JOB_ROOT, name)
+        try:
+            if os.path.getmtime(directory) < cutoff:
+                shutil.rmtree(directory, ignore_errors=True)
+        except OSError:
+            continue  # Removed concurrently by another worker
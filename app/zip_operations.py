@@ -1,7 +1,105 @@
 import zipfile
 import os
+import time
+
+# Deflate level of the decrypted ZIP: 0 stores the files uncompressed (the original behaviour), 1-9 deflate them
+ZIP_COMPRESS_LEVEL = int(os.environ.get('ZIP_COMPRESS_LEVEL', 0))
+CHUNK_SIZE = 65536
 
 def create_zip_from_files(file_paths, output_path):
     with zipfile.ZipFile(output_path, 'w') as zipf:
         for file_path in file_paths:
-            zipf.write(file_path, os.path.basename(file_path))
\ No newline at end of file
+            zipf.write(file_path, os.path.basename(file_path))
+
+
+class _ChunkBuffer:
+    """Write-only file object that collects what ZipFile writes until it is drained"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_source(source):
+    """Byte chunks of an entry given as bytes, a file path, a binary file object or an iterable of chunks"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield bytes(source)
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield from iter(lambda: f.read(CHUNK_SIZE), b'')
+    elif hasattr(source, 'read'):
+        yield from iter(lambda: source.read(CHUNK_SIZE), b'')
+    else:
+        yield from source
+
+
+def source_mtime(source):
+    """ZIP date_time of an entry: the file's modification time for a path, else now"""
+    if isinstance(source, (str, os.PathLike)):
+        return time.localtime(os.path.getmtime(source))[:6]
+    return time.localtime()[:6]
+
+
+def source_size(source):
+    """Size of an entry if it is known up front, else None"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    return None
+
+
+def iter_zip(entries, compress_level=None):
+    """
+    Generate a ZIP archive as byte chunks, e.g. for a streamed Flask response.
+    entries is an iterable of (name, source) pairs, where source is bytes, a
+    file path, a binary file object or an iterable of byte chunks; it can be a
+    generator, so entries are produced only as the archive is sent. Each chunk
+    is yielded as soon as it is written, so the archive is never held whole in
+    memory or on disk. compress_level 0 stores the entries, 1-9 deflates them
+    (ZIP_COMPRESS_LEVEL when None).
+    """
+    if compress_level is None:
+        compress_level = ZIP_COMPRESS_LEVEL
+    if compress_level:
+        method, level = zipfile.ZIP_DEFLATED, compress_level
+    else:
+        method, level = zipfile.ZIP_STORED, None
+
+    # ZipFile writes local headers, data descriptors and the central directory
+    # sequentially to an unseekable file object, so the buffer can be drained
+    # after every write
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=method, compresslevel=level) as zipf:
+        for name, source in entries:
+            size = source_size(source)
+            # Entries of unknown size get ZIP64 sizes, so a generator may produce more than 4 GiB
+            force_zip64 = size is None or size > zipfile.ZIP64_LIMIT // 2
+            # zipf.open(name) would date the entry 1980-01-01 with no permissions (extracted as 0600);
+            # like ZipFile.write, keep the file's mtime and make it readable
+            info = zipfile.ZipInfo(name, source_mtime(source))
+            info.external_attr = 0o644 << 16
+            info.compress_type = method
+            # ZipFile applies its compresslevel only to entries it names itself
+            info._compresslevel = level
+            with zipf.open(info, 'w', force_zip64=force_zip64) as entry:
+                for chunk in iter_source(source):
+                    entry.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    yield buffer.drain()
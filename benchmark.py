@@ -0,0 +1,446 @@
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import argparse
+
+# Get the absolute path of the project root
+project_root = os.path.dirname(os.path.abspath(__file__))
+
+# Add the project root and app directory to Python path (same layout as run.py)
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'app'))
+
+import image_operations
+import file_operations
+import compression
+
+SAMPLE_DIR = os.path.join(project_root, 'sample')
+
+
+def generate_text_file(path, size):
+    """Write roughly `size` bytes of printable ASCII source-like text"""
+    rng = random.Random(size)
+    words = ['def', 'return', 'pixel', 'image', 'encrypt', 'value', 'for', 'in', 'if', 'else', '(', ')', ':', '=']
+    lines = []
+    written = 0
+    while written < size:
+        line = ' '.join(rng.choice(words) for _ in range(rng.randint(3, 12)))
+        lines.append(line)
+        written += len(line) + 1
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return path
+
+
+def corpus(workdir, sizes):
+    """The sample/ files plus generated inputs of the requested sizes"""
+    files = sorted(os.path.join(SAMPLE_DIR, name) for name in os.listdir(SAMPLE_DIR))
+    for size in sizes:
+        files.append(generate_text_file(os.path.join(workdir, f'generated_{size}.txt'), size))
+    return files
+
+
+def timed(func, *args, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def quiet(func):
+    """Silence the pipeline's progress prints while timing"""
+    def wrapper(*args):
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            return func(*args)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+    return wrapper
+
+
+def peak_rss(call, *args):
+    """
+    Run image_operations.<call>(*args) in a fresh interpreter and return
+    (seconds, peak RSS in MB), so every measurement starts from an empty heap
+    """
+    import json
+    import subprocess
+
+    code = (
+        "import sys, os, io, json, time, resource, contextlib\n"
+        f"sys.path.insert(0, {os.path.join(project_root, 'app')!r})\n"
+        "import image_operations\n"
+        "args = json.loads(sys.argv[2])\n"
+        "start = time.perf_counter()\n"
+        "with contextlib.redirect_stdout(io.StringIO()):\n"
+        "    if sys.argv[1]:\n"
+        "        getattr(image_operations, sys.argv[1])(*args)\n"
+        "elapsed = time.perf_counter() - start\n"
+        # ru_maxrss survives fork+exec, so it would report the benchmark's own peak; VmHWM starts afresh
+        "peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+        "if os.path.exists('/proc/self/status'):\n"
+        "    peak = next(int(line.split()[1]) for line in open('/proc/self/status') if line.startswith('VmHWM'))\n"
+        "print(elapsed, peak)\n"
+    )
+    output = subprocess.run([sys.executable, '-c', code, call or '', json.dumps(args)],
+                            check=True, capture_output=True, text=True).stdout.split()
+    return float(output[0]), int(output[1]) / 1024  # both are in KB on Linux
+
+
+def bench_streaming(files):
+    """Peak memory of the in-memory and streaming encoder and decoder, each in its own process"""
+    _, baseline = peak_rss(None)
+    print(f"Interpreter with image_operations imported: {baseline:.0f} MB")
+    print(f"{'file':<28}{'bytes':>12}{'operation':>11}{'in-memory (s)':>15}{'RSS (MB)':>10}"
+          f"{'streaming (s)':>15}{'RSS (MB)':>10}")
+    for path in files:
+        name = os.path.basename(path)
+        image_path = os.path.abspath('bench.png')
+        for operation, in_memory, streaming, args in (
+                ('encrypt', 'encrypt_file', 'encrypt_file_streaming', [path, image_path]),
+                ('decrypt', 'decrypt_file', 'decrypt_file_streaming', [image_path, os.path.abspath('bench.out')])):
+            memory_time, memory_rss = peak_rss(in_memory, *args)
+            stream_time, stream_rss = peak_rss(streaming, *args)
+            print(f"{name:<28}{os.path.getsize(path):>12}{operation:>11}{memory_time:>15.3f}{memory_rss:>10.0f}"
+                  f"{stream_time:>15.3f}{stream_rss:>10.0f}")
+
+
+def bench_encode(files):
+    print(f"{'file':<28}{'bytes':>12}{'legacy (s)':>14}{'in-memory (s)':>16}{'speedup':>10}")
+    for path in files:
+        legacy_time, _ = timed(quiet(image_operations.encrypt_file_legacy), path)
+        # An explicit image name bypasses the image store, which would turn repeats into lookups
+        fast_time, _ = timed(quiet(image_operations.encrypt_file), path, 'bench.png')
+        name = os.path.basename(path)
+        print(f"{name:<28}{os.path.getsize(path):>12}{legacy_time:>14.4f}{fast_time:>16.4f}{legacy_time / fast_time:>9.1f}x")
+
+
+def bench_decode(files):
+    print(f"{'file':<28}{'bytes':>12}{'legacy (s)':>14}{'in-memory (s)':>16}{'speedup':>10}")
+    for path in files:
+        image_path = quiet(image_operations.encrypt_file)(path, 'bench.png')
+        legacy_time, _ = timed(quiet(image_operations.decrypt_file_legacy), image_path)
+        fast_time, _ = timed(quiet(image_operations.decrypt_file), image_path)
+        name = os.path.basename(path)
+        print(f"{name:<28}{os.path.getsize(path):>12}{legacy_time:>14.4f}{fast_time:>16.4f}{legacy_time / fast_time:>9.1f}x")
+
+
+def bench_profiles(files):
+    print(f"{'file':<28}{'profile':<10}{'payload':>12}{'png bytes':>12}{'bytes/byte':>12}{'encode (s)':>12}{'decode (s)':>12}")
+    for path in files:
+        payload = quiet(file_operations.text_to_payload)(path)
+        for profile in image_operations.PNG_PROFILES:
+            image_name = f'bench_{profile}.png'
+            encode_time, _ = timed(quiet(image_operations.payload_to_png), payload, image_name, profile)
+            decode_time, _ = timed(quiet(image_operations.png_to_payload), image_name)
+            size = os.path.getsize(image_name)
+            name = os.path.basename(path)
+            print(f"{name:<28}{profile:<10}{len(payload):>12}{size:>12}{size / max(1, len(payload)):>12.3f}{encode_time:>12.4f}{decode_time:>12.4f}")
+
+
+def bench_compression(files, profile='fast'):
+    """End to end: encrypt with each payload compressor, then build the PDF from the image"""
+    from pdf_operations import create_pdf_from_images
+
+    print(f"profile: {profile}")
+    print(f"{'file':<28}{'compression':<13}{'bytes':>12}{'png bytes':>12}{'pdf bytes':>12}{'ratio':>8}{'encrypt+pdf (s)':>17}")
+    for path in files:
+        name = os.path.basename(path)
+
+        def encrypt_and_build(method):
+            image_path = image_operations.encrypt_file(path, 'bench.png', profile, 'bytes', name, method)
+            create_pdf_from_images([image_path], 'bench.pdf')
+            return image_path
+
+        for method in compression.COMPRESSIONS:
+            elapsed, _ = timed(quiet(encrypt_and_build), method)
+            size = os.path.getsize(path)
+            pdf_size = os.path.getsize('bench.pdf')
+            print(f"{name:<28}{method:<13}{size:>12}{os.path.getsize('bench.png'):>12}{pdf_size:>12}"
+                  f"{size / pdf_size:>7.1f}x{elapsed:>17.4f}")
+
+
+def bench_pdf(files, profile='fast'):
+    """PDF assembly: FPDF reading the PNGs back from disk vs. build_pdf from paths and from memory"""
+    import io
+    from pdf_operations import create_pdf_from_images, build_pdf
+
+    image_paths = []
+    buffers = []
+    for index, path in enumerate(files):
+        image_path = quiet(image_operations.encrypt_file)(path, f'bench_{index}.png', profile, 'bytes', os.path.basename(path))
+        image_paths.append(image_path)
+        with open(image_path, 'rb') as f:
+            buffers.append(f.read())
+    total = sum(len(buffer) for buffer in buffers)
+    print(f"{len(files)} images, {total} PNG bytes, profile {profile}")
+
+    def to_memory():
+        return build_pdf(buffers, io.BytesIO())
+
+    fpdf_time, _ = timed(create_pdf_from_images, image_paths, 'bench_fpdf.pdf')
+    paths_time, _ = timed(build_pdf, image_paths, 'bench_build.pdf')
+    memory_time, out = timed(to_memory)
+    print(f"{'method':<40}{'pdf bytes':>12}{'time (s)':>12}")
+    print(f"{'create_pdf_from_images (FPDF, paths)':<40}{os.path.getsize('bench_fpdf.pdf'):>12}{fpdf_time:>12.4f}")
+    print(f"{'build_pdf (paths -> file)':<40}{os.path.getsize('bench_build.pdf'):>12}{paths_time:>12.4f}")
+    print(f"{'build_pdf (buffers -> BytesIO)':<40}{len(out.getvalue()):>12}{memory_time:>12.4f}")
+
+
+def bench_upload(files, profile='fast'):
+    """/encrypt input: saving the upload and re-reading it vs. encoding from the upload stream"""
+    import io
+
+    print(f"profile: {profile}")
+    print(f"{'file':<28}{'bytes':>12}{'save+encrypt_file (s)':>24}{'encrypt_stream (s)':>20}{'speedup':>10}")
+    for path in files:
+        name = os.path.basename(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        def save_then_encrypt():
+            upload = io.BytesIO(data)
+            with open('upload.bin', 'wb') as out:
+                shutil.copyfileobj(upload, out)
+            return image_operations.encrypt_file('upload.bin', 'bench.png', profile, 'bytes', name)
+
+        def from_stream():
+            return image_operations.encrypt_stream(io.BytesIO(data), 'bench.png', profile, 'bytes', name)
+
+        saved_time, _ = timed(quiet(save_then_encrypt))
+        stream_time, _ = timed(quiet(from_stream))
+        print(f"{name:<28}{len(data):>12}{saved_time:>24.4f}{stream_time:>20.4f}{saved_time / stream_time:>9.1f}x")
+
+
+def bench_zip(files):
+    """Decrypted ZIP: writing the archive to disk before sending it vs. streaming it entry by entry"""
+    from zip_operations import create_zip_from_files, iter_zip
+
+    total = sum(os.path.getsize(path) for path in files)
+    print(f"{len(files)} files, {total} bytes")
+
+    def on_disk():
+        start = time.perf_counter()
+        create_zip_from_files(files, 'bench.zip')
+        with open('bench.zip', 'rb') as f:
+            f.read(65536)
+            first_byte = time.perf_counter() - start
+            while f.read(65536):
+                pass
+        return time.perf_counter() - start, first_byte, os.path.getsize('bench.zip')
+
+    def streamed(level):
+        start = time.perf_counter()
+        first_byte = None
+        size = 0
+        for chunk in iter_zip(((os.path.basename(path), path) for path in files), level):
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            size += len(chunk)
+        return time.perf_counter() - start, first_byte, size
+
+    print(f"{'method':<34}{'zip bytes':>12}{'first byte (s)':>16}{'total (s)':>12}")
+    # Best of three runs, timing the first byte and the whole archive in the same run
+    total_time, first_byte, size = min(on_disk() for _ in range(3))
+    print(f"{'create_zip_from_files + read':<34}{size:>12}{first_byte:>16.4f}{total_time:>12.4f}")
+    for level in (0, 1, 6):
+        total_time, first_byte, size = min(streamed(level) for _ in range(3))
+        label = f'iter_zip (level {level})'
+        print(f"{label:<34}{size:>12}{first_byte:>16.4f}{total_time:>12.4f}")
+
+
+def bench_passwords(methods, logins=20):
+    """Password verification cost: logins per second on one core, and on all cores through the hashing pool"""
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.security import generate_password_hash, check_password_hash
+
+    cores = os.cpu_count() or 1
+    print(f"{'method':<26}{'hash (s)':>10}{'verify (s)':>12}{'logins/s/core':>15}{f'logins/s ({cores} threads)':>24}")
+    for method in methods:
+        pwhash = generate_password_hash('Correct-Horse-1', method)
+        hash_time, _ = timed(generate_password_hash, 'Correct-Horse-1', method)
+        verify_time, _ = timed(check_password_hash, pwhash, 'Correct-Horse-1')
+
+        # The hash functions release the GIL, so threads verify on every core
+        with ThreadPoolExecutor(max_workers=cores) as executor:
+            start = time.perf_counter()
+            list(executor.map(lambda _: check_password_hash(pwhash, 'Correct-Horse-1'), range(logins * cores)))
+            parallel_rate = logins * cores / (time.perf_counter() - start)
+        print(f"{method:<26}{hash_time:>10.4f}{verify_time:>12.4f}{1 / verify_time:>15.1f}{parallel_rate:>24.1f}")
+
+
+def start_chatbot_stub(fail_first=0, status=503, retry_after=None):
+    """
+    Local stand-in for the chatbot API on a free port, speaking the
+    choices[0].message.content response shape with HTTP/1.1 keep-alive. The
+    first fail_first requests get status (with Retry-After if given); a
+    negative fail_first fails every request. Returns (server, url, stats),
+    where stats counts requests and TCP connections.
+    """
+    import json
+    import socket
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    stats = {"requests": 0, "connections": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            # Headers and body are written separately; without TCP_NODELAY every keep-alive reply waits for a delayed ACK
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with lock:
+                stats["connections"] += 1
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            with lock:
+                stats["requests"] += 1
+                failing = fail_first < 0 or stats["requests"] <= fail_first
+            if failing:
+                body = b'{"error": {"message": "unavailable"}}'
+                self.send_response(status)
+                if retry_after is not None:
+                    self.send_header('Retry-After', str(retry_after))
+            else:
+                content = f"Stub reply to {len(request.get('messages', []))} messages"
+                body = json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]}).encode()
+                self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions", stats
+
+
+def bench_chatbot(calls=200):
+    """Chatbot API client against a local stub: a new connection per call vs. the pooled client, retries and the circuit breaker"""
+    import requests
+    import chatbot_client
+
+    data = {"model": "stub", "messages": [{"role": "user", "content": "Hello"}]}
+
+    def per_call(url):
+        return requests.post(url, json=data).json()["choices"][0]["message"]["content"]
+
+    server, url, stats = start_chatbot_stub()
+    client = chatbot_client.ChatbotClient()
+    try:
+        print(f"{'method':<42}{'ms/call':>10}{'new conns':>13}")
+        for label, post in (('requests.post per call', per_call),
+                            ('ChatbotClient (pooled)', lambda url: client.post(url, json=data).json())):
+            post(url)
+            stats["connections"] = 0
+            start = time.perf_counter()
+            for _ in range(calls):
+                post(url)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<42}{elapsed / calls * 1000:>10.3f}{stats['connections']:>13}")
+    finally:
+        client.close()
+        server.shutdown()
+
+    # Two 503s with Retry-After: 0, then a reply: retried within one call
+    server, url, stats = start_chatbot_stub(fail_first=2, retry_after=0)
+    client = chatbot_client.ChatbotClient(backoff_seconds=0.05)
+    try:
+        start = time.perf_counter()
+        response = quiet(lambda: client.post(url, json=data))()
+        elapsed = time.perf_counter() - start
+        print(f"{'2 x 503 then 200':<42}{elapsed * 1000:>10.3f}{'':>13}  -> {response.status_code} after {stats['requests']} requests")
+    finally:
+        client.close()
+        server.shutdown()
+
+    # API down: with the breaker, calls fail without a request once it opens
+    server, url, stats = start_chatbot_stub(fail_first=-1)
+    try:
+        for label, failures in (('API down, 20 calls, no breaker', 0), ('API down, 20 calls, breaker after 5', 5)):
+            stats["requests"] = 0
+            client = chatbot_client.ChatbotClient(backoff_seconds=0.05,
+                                                  breaker=chatbot_client.CircuitBreaker(failures, 30))
+
+            def call():
+                try:
+                    return client.post(url, json=data).status_code
+                except chatbot_client.CircuitOpenError:
+                    return None
+
+            start = time.perf_counter()
+            results = [quiet(call)() for _ in range(20)]
+            elapsed = time.perf_counter() - start
+            client.close()
+            print(f"{label:<42}{elapsed / 20 * 1000:>10.3f}{'':>13}  -> {stats['requests']} requests, "
+                  f"{results.count(None)} failed fast")
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PixelMind codec benchmarks')
+    parser.add_argument('suite', choices=['encode', 'decode', 'profiles', 'compression', 'pdf', 'zip', 'upload', 'streaming', 'passwords', 'chatbot'], help='benchmark to run')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[100_000, 1_000_000, 10_000_000],
+                        help='sizes in bytes of generated inputs added to the sample/ corpus')
+    parser.add_argument('--profile', default='fast', choices=list(image_operations.PNG_PROFILES),
+                        help='PNG profile used by the compression, pdf and upload suites')
+    parser.add_argument('--methods', nargs='*',
+                        default=['scrypt:32768:8:1', 'scrypt:16384:8:1', 'pbkdf2:sha256:1000000',
+                                 'pbkdf2:sha256:600000', 'pbkdf2:sha256:260000'],
+                        help='werkzeug password hash methods compared by the passwords suite')
+    args = parser.parse_args()
+
+    if args.suite == 'passwords':
+        bench_passwords(args.methods)
+        return
+    if args.suite == 'chatbot':
+        bench_chatbot()
+        return
+
+    # The pipelines write to relative temp/ and enimg/ paths, so run inside a scratch directory
+    workdir = tempfile.mkdtemp(prefix='pixelmind_bench_')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        files = corpus(workdir, args.sizes)
+        if args.suite == 'encode':
+            bench_encode(files)
+        elif args.suite == 'decode':
+            bench_decode(files)
+        elif args.suite == 'profiles':
+            bench_profiles(files)
+        elif args.suite == 'compression':
+            bench_compression(files, args.profile)
+        elif args.suite == 'pdf':
+            bench_pdf(files, args.profile)
+        elif args.suite == 'zip':
+            bench_zip(files)
+        elif args.suite == 'upload':
+            bench_upload(files, args.profile)
+        elif args.suite == 'streaming':
+            bench_streaming(files)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import json
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'app'))
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import activity_log
+import database
+
+
+class FakeActivityLogs:
+    """insert_many like pymongo's: _id added to each dict first, then an unordered write"""
+
+    def __init__(self):
+        self.stored = {}
+        self.down = False
+        self.reject_once = set()
+
+    def insert_many(self, documents, ordered=True):
+        for document in documents:
+            document.setdefault('_id', ObjectId())
+        if self.down:
+            raise AutoReconnect('connection refused')
+        errors = []
+        for index, document in enumerate(documents):
+            if document['_id'] in self.stored:
+                errors.append({'index': index, 'code': database.DUPLICATE_KEY_ERROR})
+            elif document['filename'] in self.reject_once:
+                self.reject_once.discard(document['filename'])
+                errors.append({'index': index, 'code': 91})
+            else:
+                self.stored[document['_id']] = dict(document)
+        if errors:
+            raise BulkWriteError({'writeErrors': errors})
+
+
+class FakeDb:
+    def __init__(self):
+        self.activity_logs = FakeActivityLogs()
+
+
+@pytest.fixture
+def logs(monkeypatch, tmp_path, capsys):
+    # A fresh queue whose writer thread never flushes on its own
+    activity_log.shutdown()
+    monkeypatch.setattr(activity_log, '_queue', None)
+    monkeypatch.setattr(activity_log, 'FLUSH_SECONDS', 1000)
+    monkeypatch.setattr(activity_log, 'BATCH_SIZE', 3)
+    monkeypatch.setattr(activity_log, 'RETRIES', 2)
+    monkeypatch.setattr(activity_log, 'FALLBACK_PATH', str(tmp_path / 'failed.jsonl'))
+    db = FakeDb()
+    monkeypatch.setattr(database, 'get_db', lambda: db)
+    yield db.activity_logs
+    activity_log.shutdown()
+
+
+def fallback_events():
+    with open(activity_log.FALLBACK_PATH, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_failed_batch_is_retried_in_order(logs):
+    for i in range(5):
+        activity_log.log('user', 'encrypt', f'a{i}')
+    logs.down = True
+    assert activity_log.flush() == 0
+    logs.down = False
+    assert activity_log.flush() == 5
+    assert [event['filename'] for event in logs.stored.values()] == ['a0', 'a1', 'a2', 'a3', 'a4']
+
+
+def test_unreachable_database_saves_events_to_fallback(logs):
+    for i in range(4):
+        activity_log.log('user', 'encrypt', f'b{i}')
+    logs.down = True
+    for _ in range(activity_log.RETRIES + 1):
+        assert activity_log.flush() == 0
+
+    events = fallback_events()
+    assert [event['filename'] for event in events] == ['b0', 'b1', 'b2', 'b3']
+    # The batch that was tried carries the ObjectId _id insert_many gave it
+    assert all(ObjectId.is_valid(event['_id']) for event in events[:3])
+    assert '_id' not in events[3]
+    assert activity_log._queue.qsize() == 0
+
+
+def test_partial_insert_retries_only_the_failed_events(logs):
+    logs.reject_once.add('c1')
+    for i in range(3):
+        activity_log.log('user', 'encrypt', f'c{i}')
+    assert activity_log.flush() == 2
+    assert activity_log._failed_batch is not None
+    assert activity_log.flush() == 1
+    assert activity_log._failed_batch is None
+    assert sorted(event['filename'] for event in logs.stored.values()) == ['c0', 'c1', 'c2']
+
+
+def test_retry_after_unknown_outcome_counts_duplicates_as_written(logs):
+    for i in range(3):
+        activity_log.log('user', 'encrypt', f'd{i}')
+    # The insert reaches MongoDB but the reply is lost, so the whole batch is retried
+    real_insert = logs.insert_many
+
+    def lost_reply(documents, ordered=True):
+        real_insert(documents, ordered)
+        raise AutoReconnect('connection reset')
+    logs.insert_many = lost_reply
+    assert activity_log.flush() == 0
+
+    logs.insert_many = real_insert
+    assert activity_log.flush() == 3
+    assert activity_log._failed_batch is None
+    assert len(logs.stored) == 3
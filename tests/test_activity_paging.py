@@ -0,0 +1,80 @@
+import datetime
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'app'))
+
+import pytest
+from bson import ObjectId
+
+mongomock = pytest.importorskip('mongomock')
+
+import database
+
+BASE = datetime.datetime(2024, 5, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def activities(monkeypatch):
+    db = mongomock.MongoClient().pixelmind_test
+    monkeypatch.setattr(database, 'get_db', lambda: db)
+    # Nine events of one user, four of them sharing a timestamp, plus another user's event
+    events = []
+    for i, minute in enumerate([0, 1, 2, 2, 2, 2, 3, 4, 5]):
+        events.append({"_id": ObjectId(), "username": "alice", "action_type": "encrypt" if i % 3 else "decrypt",
+                       "filename": f"file{i}.txt", "timestamp": BASE + datetime.timedelta(minutes=minute)})
+    events.append({"_id": ObjectId(), "username": "bob", "action_type": "encrypt", "filename": "bob.txt",
+                   "timestamp": BASE})
+    db.activity_logs.insert_many([dict(event) for event in events])
+    return events
+
+
+def newest_first(events):
+    return [event["filename"] for event in sorted(events, key=lambda e: (e["timestamp"], e["_id"]), reverse=True)]
+
+
+def all_pages(limit, **filters):
+    pages, cursor = [], None
+    while True:
+        page, cursor = database.get_activity_page(limit=limit, cursor=cursor, **filters)
+        pages.append([activity["filename"] for activity in page])
+        if cursor is None:
+            return pages
+
+
+def test_cursor_roundtrip():
+    activity = {"timestamp": BASE, "_id": ObjectId()}
+    cursor = database.encode_activity_cursor(activity)
+    assert '=' not in cursor
+    assert database.decode_activity_cursor(cursor) == (BASE, activity["_id"])
+
+
+@pytest.mark.parametrize('cursor', ['', 'not a cursor', 'bm90LWEtZGF0ZXxhYmM'])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        database.decode_activity_cursor(cursor)
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 4, 9, 10])
+def test_pages_split_shared_timestamps_without_gaps_or_repeats(activities, limit):
+    alice = [event for event in activities if event["username"] == "alice"]
+    pages = all_pages(limit, username="alice")
+
+    assert [name for page in pages for name in page] == newest_first(alice)
+    assert all(len(page) == limit for page in pages[:-1])
+    assert 0 < len(pages[-1]) <= limit
+
+
+def test_filters_apply_to_every_page(activities):
+    start, end = BASE + datetime.timedelta(minutes=1), BASE + datetime.timedelta(minutes=4)
+    expected = [event for event in activities if event["username"] == "alice" and event["action_type"] == "encrypt"
+                and start <= event["timestamp"] < end]
+    pages = all_pages(2, username="alice", action_type="encrypt", start=start, end=end)
+    assert [name for page in pages for name in page] == newest_first(expected)
+
+
+def test_pages_do_not_expose_ids(activities):
+    page, _ = database.get_activity_page(username="alice", limit=3)
+    assert all("_id" not in activity for activity in page)
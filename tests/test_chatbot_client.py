@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'app'))
+
+import pytest
+import requests
+
+import chatbot_client
+from benchmark import start_chatbot_stub
+
+BODY = {"model": "stub", "messages": [{"role": "user", "content": "Hello"}]}
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**kwargs):
+        server, url, stats = start_chatbot_stub(**kwargs)
+        servers.append(server)
+        return url, stats
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def client(**kwargs):
+    kwargs.setdefault('backoff_seconds', 0)
+    kwargs.setdefault('breaker', chatbot_client.CircuitBreaker(max_failures=0))
+    return chatbot_client.ChatbotClient(**kwargs)
+
+
+def test_calls_reuse_one_connection(stub):
+    url, stats = stub()
+    api = client()
+    for _ in range(5):
+        assert api.post(url, json=BODY).status_code == 200
+    assert stats == {"requests": 5, "connections": 1}
+
+
+def test_retries_until_the_api_recovers(stub):
+    url, stats = stub(fail_first=2, retry_after=0)
+    response = client(max_retries=2).post(url, json=BODY)
+    assert response.status_code == 200
+    assert stats["requests"] == 3
+
+
+def test_last_failure_is_returned_once_retries_are_used_up(stub):
+    url, stats = stub(fail_first=-1)
+    response = client(max_retries=1).post(url, json=BODY)
+    assert response.status_code == 503
+    assert stats["requests"] == 2
+
+
+def test_long_retry_after_is_not_waited_for(stub):
+    url, stats = stub(fail_first=-1, status=429, retry_after=60)
+    started = time.monotonic()
+    response = client(max_retries=3, max_backoff_seconds=1).post(url, json=BODY)
+    assert response.status_code == 429
+    assert stats["requests"] == 1
+    assert time.monotonic() - started < 5
+
+
+def test_connection_errors_are_retried_then_raised():
+    breaker = chatbot_client.CircuitBreaker(max_failures=5)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client(max_retries=2, breaker=breaker, connect_timeout=1).post('http://127.0.0.1:9/v1/chat', json=BODY)
+    assert breaker._failures == 1
+
+
+def test_circuit_opens_then_lets_one_trial_call_through(stub):
+    failing_url, failing = stub(fail_first=-1)
+    working_url, working = stub()
+    breaker = chatbot_client.CircuitBreaker(max_failures=2, reset_seconds=0.2)
+    api = client(max_retries=0, breaker=breaker)
+
+    for _ in range(2):
+        assert api.post(failing_url, json=BODY).status_code == 503
+    assert breaker.state == 'open'
+    with pytest.raises(chatbot_client.CircuitOpenError):
+        api.post(working_url, json=BODY)
+    assert working["requests"] == 0
+
+    # After the pause one trial call goes through; its failure opens the circuit again
+    time.sleep(0.25)
+    assert breaker.state == 'half-open'
+    assert api.post(failing_url, json=BODY).status_code == 503
+    assert breaker.state == 'open'
+    assert failing["requests"] == 3
+
+    # A successful trial closes it
+    time.sleep(0.25)
+    assert api.post(working_url, json=BODY).status_code == 200
+    assert breaker.state == 'closed'
+    assert api.post(working_url, json=BODY).status_code == 200
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    response = requests.Response()
+    response.headers['Retry-After'] = '2.5'
+    assert chatbot_client.retry_after(response) == 2.5
+    response.headers['Retry-After'] = 'Wed, 21 Oct 2015 07:28:00 GMT'
+    assert chatbot_client.retry_after(response) == 0.0
+    response.headers['Retry-After'] = 'soon'
+    assert chatbot_client.retry_after(response) is None
@@ -0,0 +1,41 @@
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'app'))
+
+import pytest
+
+import chatbot_service
+
+
+def turn(question, answer):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+
+@pytest.mark.parametrize('chars, min_chars, expected', [
+    (12000, 100, 40),  # the message cap binds
+    (2000, 100, 20),
+    (2050, 100, 21),
+    (0, 100, 40),      # no character budget
+    (2000, 0, 40),     # fetch not sized by the budget
+])
+def test_fetch_limit_follows_the_budget(monkeypatch, chars, min_chars, expected):
+    monkeypatch.setattr(chatbot_service, 'CHATBOT_HISTORY_MESSAGES', 40)
+    monkeypatch.setattr(chatbot_service, 'CHATBOT_HISTORY_CHARS', chars)
+    monkeypatch.setattr(chatbot_service, 'CHATBOT_MIN_MESSAGE_CHARS', min_chars)
+    assert chatbot_service.history_fetch_limit() == expected
+
+
+def test_trim_keeps_the_newest_messages_that_fit():
+    messages = turn('q1', 'a' * 50) + turn('q2', 'b' * 50) + turn('q3', 'c' * 50)
+    assert chatbot_service.trim_history(messages, 110) == messages[2:]
+    assert chatbot_service.trim_history(messages, 0) == messages
+
+
+def test_trim_never_starts_with_a_reply():
+    messages = turn('q1', 'a' * 50) + turn('q2', 'b' * 50)
+    assert chatbot_service.trim_history(messages, 101) == messages[2:]
+    # Only the last reply fits, and it is not sent without its question
+    assert chatbot_service.trim_history(messages, 51) == []
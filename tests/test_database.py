@@ -0,0 +1,78 @@
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'app'))
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+import database
+
+PASSWORD = 'Passw0rdOK'
+
+
+class RacingCollection:
+    """A collection whose next `misses` find_one calls see nothing, like a check made just before another request's insert"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.misses = 0
+
+    def find_one(self, *args, **kwargs):
+        if self.misses:
+            self.misses -= 1
+            return None
+        return self.collection.find_one(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class RacingDb:
+    def __init__(self, db):
+        self.db = db
+        self.users = RacingCollection(db.users)
+        self.user_memory = RacingCollection(db.user_memory)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    mongo = mongomock.MongoClient().pixelmind_test
+    for collection, keys, options in database.INDEXES:
+        mongo[collection].create_index(keys, **options)
+    racing = RacingDb(mongo)
+    monkeypatch.setattr(database, 'get_db', lambda: racing)
+    return racing
+
+
+def test_concurrent_signup_reports_the_taken_username(db):
+    assert database.create_user('alice', PASSWORD, 'alice@example.com') == (True, "User created successfully")
+    db.users.misses = 2
+    assert database.create_user('alice', PASSWORD, 'other@example.com') == (False, "Username already exists")
+    db.users.misses = 2
+    assert database.create_user('bob', PASSWORD, 'alice@example.com') == (False, "Email already exists")
+    assert db.users.count_documents({}) == 1
+
+
+def test_concurrent_google_sign_in_finds_the_new_user(db):
+    assert database.create_google_user('alice', 'random', 'alice@example.com') == (True, "User created successfully")
+    db.users.misses = 1
+    assert database.create_google_user('alice', 'random', 'alice@example.com') == (True, "User already exists")
+    db.users.misses = 1
+    assert database.create_google_user('alice', 'random', 'new@example.com') == (False, "Username already exists")
+    assert db.users.count_documents({}) == 1
+
+
+def test_concurrent_first_messages_share_one_memory_document(db):
+    first = database.get_user_memory('alice')
+    assert {key: first[key] for key in database.MEMORY_DEFAULTS} == database.MEMORY_DEFAULTS
+    db.user_memory.misses = 1
+    second = database.get_user_memory('alice')
+    assert second['_id'] == first['_id']
+    assert db.user_memory.count_documents({}) == 1
@@ -0,0 +1,65 @@
+import os
+import sys
+from collections import OrderedDict
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'app'))
+
+import pytest
+
+import decrypt_cache
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    # Memory tier of 800 bytes (entries up to 100 bytes), disk tier of 1000 bytes
+    monkeypatch.setattr(decrypt_cache, 'CACHE_DIR', str(tmp_path / 'decrypt_cache'))
+    monkeypatch.setattr(decrypt_cache, 'MEMORY_LIMIT_BYTES', 800)
+    monkeypatch.setattr(decrypt_cache, 'DISK_LIMIT_BYTES', 1000)
+    monkeypatch.setattr(decrypt_cache, '_memory', OrderedDict())
+    monkeypatch.setattr(decrypt_cache, '_memory_bytes', 0)
+    monkeypatch.setattr(decrypt_cache, '_disk_bytes', None)
+    monkeypatch.setattr(decrypt_cache, '_stats', dict.fromkeys(decrypt_cache._stats, 0))
+    return decrypt_cache
+
+
+def test_key_is_the_image_hash(cache):
+    assert cache.cache_key(b'pixels') == cache.cache_key(bytearray(b'pixels'))
+    assert cache.cache_key(b'pixels') != cache.cache_key(b'pixels!')
+
+
+def test_miss_then_memory_hit(cache):
+    key = cache.cache_key(b'image')
+    assert cache.get(key) is None
+    cache.put(key, b'decrypted')
+    assert cache.get(key) == b'decrypted'
+
+    stats = cache.stats()
+    assert (stats['misses'], stats['memory_hits'], stats['stores']) == (1, 1, 1)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_entry_evicted_from_memory_is_read_back_from_disk(cache):
+    keys = [cache.cache_key(bytes([i])) for i in range(9)]
+    for key in keys:
+        cache.put(key, (key * 2)[:100].encode())
+    assert keys[0] not in cache._memory
+    assert cache.stats()['memory_evictions'] == 1
+
+    assert cache.get(keys[0]) == (keys[0] * 2)[:100].encode()
+    assert cache.stats()['disk_hits'] == 1
+    # The disk hit is back in the memory tier
+    assert keys[0] in cache._memory
+
+
+def test_large_entries_skip_memory_and_disk_is_trimmed_lru(cache):
+    keys = [cache.cache_key(bytes([i])) for i in range(5)]
+    for key in keys:
+        cache.put(key, b'x' * 300)
+    assert not cache._memory
+
+    stats = cache.stats()
+    assert stats['disk_evictions'] > 0
+    assert stats['disk_bytes'] <= cache.DISK_LIMIT_BYTES * 9 // 10
+    assert cache.get(keys[-1]) == b'x' * 300
@@ -0,0 +1,66 @@
+import os
+import struct
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'app'))
+
+import pytest
+
+import image_operations
+from compression import COMPRESSIONS
+
+
+def test_plain_header_is_the_legacy_length_word():
+    header = image_operations.pack_header(1234)
+    assert header == struct.pack('>I', 1234)
+    assert image_operations.parse_header(header + b'payload') == \
+        {'length': 1234, 'flags': 0, 'name': None, 'shard': None, 'size': 4}
+
+
+def test_extended_header_roundtrip():
+    set_id = bytes(range(16))
+    header = image_operations.pack_header(99, image_operations.FLAG_RAW, 'résumé.pdf', (set_id, 2, 5))
+    parsed = image_operations.parse_header(header + b'\x00' * 10)
+
+    assert parsed['length'] == 99
+    assert parsed['flags'] & image_operations.FLAG_RAW
+    assert parsed['name'] == 'résumé.pdf'
+    assert parsed['shard'] == {'id': set_id.hex(), 'index': 2, 'count': 5}
+    assert parsed['size'] == len(header)
+    # Every shorter prefix is reported as incomplete rather than misread
+    for cut in range(len(header)):
+        assert image_operations.parse_header(header[:cut]) is None
+
+
+def test_unknown_header_version_is_rejected():
+    header = bytearray(image_operations.pack_header(10, image_operations.FLAG_RAW))
+    header[4] = image_operations.HEADER_VERSION + 1
+    with pytest.raises(ValueError, match='version'):
+        image_operations.parse_header(bytes(header))
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+def test_bytes_codec_restores_exact_bytes_and_name(compression, tmp_path):
+    data = os.urandom(5000) + b'\r\n\x00' * 100
+    source = tmp_path / 'blob.bin'
+    source.write_bytes(data)
+
+    image = image_operations.encrypt_file(str(source), image_name=str(tmp_path / 'blob.png'), profile='fast',
+                                          codec='bytes', name='blob.bin', compression=compression)
+    assert image_operations.decrypt_image_bytes(image) == (data, 'blob.bin')
+
+
+@pytest.mark.parametrize('codec', image_operations.CODECS)
+def test_streaming_encoder_matches_in_memory_decoder(codec, tmp_path):
+    source = os.path.join(project_root, 'sample', 'sample3.html')
+    streamed = image_operations.encrypt_file_streaming(source, str(tmp_path / 'streamed.png'), chunk_size=256,
+                                                       profile='fast', codec=codec, name='sample3.html')
+    in_memory = image_operations.encrypt_file(source, str(tmp_path / 'memory.png'), profile='fast', codec=codec,
+                                              name='sample3.html')
+
+    expected = image_operations.decrypt_image_bytes(in_memory)
+    assert image_operations.decrypt_image_bytes(streamed) == expected
+    with open(image_operations.decrypt_file_streaming(streamed, str(tmp_path / 'out.txt')), 'rb') as f:
+        assert f.read() == expected[0]
@@ -0,0 +1,43 @@
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'app'))
+
+import pytest
+
+import file_operations
+import image_operations
+from workspace import Workspace
+
+SAMPLES = sorted(os.listdir(os.path.join(project_root, 'sample')))
+
+
+def legacy_png(path, tmp_path):
+    """The original pipeline: text to a binary text file, to one value per line, to ascii_to_rgb"""
+    file_operations.text_to_binary(path, str(tmp_path / 'bin_en.txt'))
+    file_operations.binary_to_ascii(str(tmp_path / 'bin_en.txt'), str(tmp_path / 'output_ascii_en.txt'))
+    return image_operations.ascii_to_rgb(str(tmp_path / 'output_ascii_en.txt'), str(tmp_path / 'legacy.png'))
+
+
+@pytest.mark.parametrize('sample', SAMPLES)
+def test_default_profile_matches_legacy_writer(sample, tmp_path):
+    path = os.path.join(project_root, 'sample', sample)
+    new = image_operations.encrypt_file(path, image_name=str(tmp_path / 'new.png'), profile='default', codec='text')
+    with open(legacy_png(path, tmp_path), 'rb') as legacy, open(new, 'rb') as current:
+        assert current.read() == legacy.read()
+
+
+@pytest.mark.parametrize('profile', sorted(image_operations.PNG_PROFILES))
+def test_legacy_and_new_images_decrypt_like_the_legacy_chain(profile, tmp_path):
+    path = os.path.join(project_root, 'sample', 'sample2.txt')
+    legacy = legacy_png(path, tmp_path)
+    new = image_operations.encrypt_file(path, image_name=str(tmp_path / 'new.png'), profile=profile, codec='text')
+    workspace = Workspace(directory=str(tmp_path / 'legacy_chain'))
+    with open(image_operations.decrypt_file_legacy(legacy, workspace), 'rb') as f:
+        expected = f.read()
+
+    for image in (legacy, new):
+        with open(image_operations.decrypt_file(image, str(tmp_path / 'out.txt')), 'rb') as f:
+            assert f.read() == expected
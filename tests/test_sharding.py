@@ -0,0 +1,51 @@
+import io
+import os
+import sys
+import tempfile
+import zipfile
+
+# Small shards, and an image store and decrypt cache of the test's own; set before the app
+# modules are imported, since the worker processes read the same variables
+SCRATCH = tempfile.mkdtemp(prefix='pixelmind_test_')
+os.environ['SHARD_MAX_DIMENSION'] = '64'
+os.environ['WORKER_POOL_SIZE'] = '2'
+os.environ['IMAGE_STORE_DIR'] = os.path.join(SCRATCH, 'enimg')
+os.environ['DECRYPT_CACHE_DIR'] = os.path.join(SCRATCH, 'decrypt_cache')
+os.environ['MONGODB_ENSURE_INDEXES'] = 'false'
+os.environ.setdefault('SECRET_KEY', 'test')
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'app'))
+
+import database
+from app import create_app
+
+
+def test_same_large_file_twice_in_one_upload(monkeypatch):
+    monkeypatch.setattr(database, 'log_user_activity', lambda **kwargs: True)
+    app = create_app()
+    app.testing = True
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'tester'
+
+    # Too large for one 64x64 image, so each copy becomes a shard set with the same content-derived id
+    large = os.urandom(40000)
+    uploads = [('large.bin', large), ('small.txt', b'between the copies'), ('large.bin', large)]
+
+    response = client.post('/encrypt', data={'files': [(io.BytesIO(data), name) for name, data in uploads],
+                                             'profile': 'fast'},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    pdf = client.get('/download_pdf').data
+
+    response = client.post('/decrypt', data={'file': (io.BytesIO(pdf), 'encrypted.pdf')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(client.get('/download_zip').data))
+
+    names = archive.namelist()
+    assert [name.split('_', 3)[-1] for name in names] == [name for name, _ in uploads]
+    for name, (_, data) in zip(names, uploads):
+        assert archive.read(name) == data
@@ -0,0 +1,42 @@
+import io
+import os
+import sys
+import time
+import zipfile
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'app'))
+
+import pytest
+
+import zip_operations
+
+
+def read_zip(entries, level):
+    return zipfile.ZipFile(io.BytesIO(b''.join(zip_operations.iter_zip(entries, level))))
+
+
+@pytest.mark.parametrize('level', [0, 1, 9])
+def test_entries_keep_mtime_and_permissions(level, tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_bytes(b'decrypted text ' * 500)
+    os.utime(path, (1600000000, 1600000000))
+
+    archive = read_zip([('notes.txt', str(path)), ('generated.bin', iter([b'abc', b'def']))], level)
+
+    notes, generated = archive.infolist()
+    assert notes.date_time == time.localtime(1600000000)[:6]
+    assert generated.date_time[0] >= 2024
+    for info in (notes, generated):
+        assert info.external_attr >> 16 == 0o644
+        assert info.compress_type == (zipfile.ZIP_DEFLATED if level else zipfile.ZIP_STORED)
+    assert archive.read('notes.txt') == path.read_bytes()
+    assert archive.read('generated.bin') == b'abcdef'
+
+
+def test_compress_level_is_applied(tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_bytes(os.urandom(2000).hex().encode())
+    fast, small = (read_zip([('notes.txt', str(path))], level).getinfo('notes.txt') for level in (1, 9))
+    assert small.compress_size < fast.compress_size